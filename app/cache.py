@@ -0,0 +1,187 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable
+
+# 认证用户缓存：容量与过期时间（秒）
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 1024))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 60))
+
+# 图书详情缓存：容量与过期时间（秒）
+BOOK_CACHE_SIZE = int(os.getenv("BOOK_CACHE_SIZE", 2048))
+BOOK_CACHE_TTL = float(os.getenv("BOOK_CACHE_TTL", 60))
+
+# 图书列表结果缓存：内存上限（字节）与过期时间（秒）
+BOOK_LIST_CACHE_BYTES = int(os.getenv("BOOK_LIST_CACHE_BYTES", 16 * 1024 * 1024))
+BOOK_LIST_CACHE_TTL = float(os.getenv("BOOK_LIST_CACHE_TTL", 30))
+
+# 分类/作者列表缓存的过期时间（秒），兜底其他 worker 进程的写入
+FACET_CACHE_TTL = float(os.getenv("FACET_CACHE_TTL", 300))
+
+
+class TTLCache:
+    """带过期时间的 LRU 缓存，记录命中/未命中次数"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is None or item[1] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def set(self, key: Hashable, value: Any):
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def discard_where(self, predicate: Callable[[Hashable, Any], bool]):
+        """删除所有满足 predicate(key, value) 的条目"""
+        for key in [k for k, (v, _) in self._data.items() if predicate(k, v)]:
+            del self._data[key]
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class ByteLRUCache(TTLCache):
+    """按值的总字节数限制容量的 LRU 缓存，值为 bytes"""
+
+    def __init__(self, max_bytes: int, ttl: float):
+        super().__init__(maxsize=0, ttl=ttl)
+        self.max_bytes = max_bytes
+        self.bytes = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+        if item is not None and item[1] < time.monotonic():
+            self.pop(key)
+        return super().get(key, default)
+
+    def set(self, key: Hashable, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        self.pop(key)
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        self.bytes += len(value)
+        while self.bytes > self.max_bytes:
+            _, (evicted, _) = self._data.popitem(last=False)
+            self.bytes -= len(evicted)
+            self.evictions += 1
+
+    def pop(self, key: Hashable):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.bytes -= len(item[0])
+
+    def discard_where(self, predicate: Callable[[Hashable, Any], bool]):
+        for key in [k for k, (v, _) in self._data.items() if predicate(k, v)]:
+            self.pop(key)
+
+    def clear(self):
+        self._data.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats.pop("maxsize")
+        stats.update(bytes=self.bytes, max_bytes=self.max_bytes)
+        return stats
+
+
+# 已注册的缓存，统计信息由 /health 输出
+_caches: dict[str, TTLCache] = {}
+
+
+def register_cache(name: str, cache: TTLCache) -> TTLCache:
+    _caches[name] = cache
+    return cache
+
+
+# 用户行同时以 ("username", 用户名) 和 ("id", 用户ID) 为 key 缓存
+user_cache = register_cache("users", TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL))
+
+
+def cache_user(user: dict):
+    user_cache.set(("username", user["username"]), user)
+    user_cache.set(("id", user["id"]), user)
+
+
+def invalidate_users(user_ids: Iterable[int]):
+    """用户信息变更后调用，清除这些用户的缓存"""
+    ids = set(user_ids)
+    user_cache.discard_where(lambda key, user: user["id"] in ids)
+
+
+# 图书分类/作者列表：字段名 -> {"body": 响应体, "etag": ETag}
+facet_cache = register_cache("facets", TTLCache(8, FACET_CACHE_TTL))
+
+# 图书列表响应体：(目录版本号, 规范化的查询参数) -> bytes
+book_list_cache = register_cache(
+    "book_lists", ByteLRUCache(BOOK_LIST_CACHE_BYTES, BOOK_LIST_CACHE_TTL)
+)
+
+# 图书目录版本号：图书增删改和借还书（库存变化）时递增，
+# 旧版本号下的列表缓存不会再被命中，由 LRU 自然淘汰，无需扫描 key
+_catalog_generation = 0
+
+
+def catalog_generation() -> int:
+    return _catalog_generation
+
+
+def bump_catalog_generation():
+    global _catalog_generation
+    _catalog_generation += 1
+
+
+def invalidate_catalog():
+    """图书增删改后调用，下次请求时重新生成分类/作者列表和图书列表"""
+    facet_cache.clear()
+    bump_catalog_generation()
+
+
+# 图书详情：图书ID -> {"row": 数据库行, "body": 响应体, "etag": ETag, "last_modified": ...}
+book_cache = register_cache("books", TTLCache(BOOK_CACHE_SIZE, BOOK_CACHE_TTL))
+
+
+def invalidate_books(book_ids: Iterable[int]):
+    """图书信息或库存变更后调用，清除这些图书的详情缓存，并使图书列表缓存失效"""
+    for book_id in set(book_ids):
+        book_cache.pop(book_id)
+    bump_catalog_generation()
+
+
+def get_cache_stats() -> dict:
+    return {name: cache.stats() for name, cache in _caches.items()}
@@ -0,0 +1,36 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+# 正在执行的计算：(名称, key) -> Task
+_inflight: dict[tuple[str, Hashable], asyncio.Task] = {}
+
+# 各名称的调用次数与被合并的请求数，由 /health 输出
+_stats: dict[str, dict] = {}
+
+
+async def single_flight(name: str, key: Hashable, factory: Callable[[], Awaitable]) -> Any:
+    """相同 (name, key) 的并发调用只执行一次 factory，所有调用方共享结果或异常
+
+    共享的计算用 shield 保护，某个调用方被取消（如客户端断开）不影响其他调用方。
+    """
+    stats = _stats.setdefault(name, {"calls": 0, "collapsed": 0})
+    stats["calls"] += 1
+    flight_key = (name, key)
+    task = _inflight.get(flight_key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        _inflight[flight_key] = task
+        task.add_done_callback(lambda _: _inflight.pop(flight_key, None))
+    else:
+        stats["collapsed"] += 1
+    return await asyncio.shield(task)
+
+
+def get_coalesce_stats() -> dict:
+    return {
+        "in_flight": len(_inflight),
+        **{
+            name: {**stats, "collapsed_rate": round(stats["collapsed"] / stats["calls"], 4)}
+            for name, stats in _stats.items()
+        },
+    }
@@ -0,0 +1,121 @@
+import asyncio
+import os
+from datetime import date, datetime
+from typing import Optional
+
+from .coalesce import single_flight
+from .database import fan_out, query
+
+# 计数器与数据库对账的间隔（秒），兜底其他 worker 进程的写入和级联删除
+COUNTER_RECONCILE_INTERVAL = float(os.getenv("COUNTER_RECONCILE_INTERVAL", 60))
+# 对账间隔的随机浮动比例，各 worker 的对账在时间上错开
+COUNTER_RECONCILE_JITTER = float(os.getenv("COUNTER_RECONCILE_JITTER", 0.5))
+
+# 对账时执行的查询，均可走索引（total_fines 除外，只在对账时计算）
+RECONCILE_QUERIES = {
+    "users": "SELECT COUNT(*) AS value FROM users",
+    "books": "SELECT COUNT(*) AS value FROM books",
+    "borrows": "SELECT COUNT(*) AS value FROM borrows",
+    "borrowed": "SELECT COUNT(*) AS value FROM borrows WHERE status = 'borrowed'",
+    "overdue": "SELECT COUNT(*) AS value FROM borrows WHERE status = 'overdue'",
+    "past_due": (
+        "SELECT COUNT(*) AS value FROM borrows "
+        "WHERE status IN ('borrowed', 'overdue') AND due_date < NOW()"
+    ),
+    "today_borrows": (
+        "SELECT COUNT(*) AS value FROM borrows "
+        "WHERE borrow_date >= CURDATE() AND borrow_date < CURDATE() + INTERVAL 1 DAY"
+    ),
+    "today_returns": (
+        "SELECT COUNT(*) AS value FROM borrows "
+        "WHERE return_date >= CURDATE() AND return_date < CURDATE() + INTERVAL 1 DAY"
+    ),
+    "total_fines": "SELECT IFNULL(SUM(fine_amount), 0) AS value FROM borrows WHERE fine_amount > 0",
+}
+
+
+class CirculationCounters:
+    """站点与借阅统计计数器
+
+    由借书/还书/用户/图书等写路径增量维护，统计接口直接读取内存；
+    定期与数据库对账，级联删除等无法增量计算的变更调用 invalidate() 触发重新对账。
+    """
+
+    def __init__(self):
+        self.values: Optional[dict] = None
+        self.day: Optional[date] = None
+        self.reconciled_at: Optional[datetime] = None
+        self.dirty = True
+        self._lock = asyncio.Lock()
+        # 对账查询进行中时记录的增量，查询结果替换 values 后再叠加上去
+        self._pending: Optional[dict] = None
+
+    def _roll_day(self):
+        if self.values is not None and self.day != date.today():
+            self.values["today_borrows"] = 0
+            self.values["today_returns"] = 0
+            self.day = date.today()
+
+    def add(self, **deltas):
+        """写路径提交后调用，例如 add(borrows=1, borrowed=1, today_borrows=1)"""
+        if self._pending is not None:
+            for name, delta in deltas.items():
+                self._pending[name] = self._pending.get(name, 0) + delta
+        if self.values is None:
+            return
+        self._roll_day()
+        for name, delta in deltas.items():
+            self.values[name] += delta
+
+    def invalidate(self):
+        self.dirty = True
+
+    def counted_past_due(self, due_date: datetime) -> bool:
+        """该在借记录是否已计入 past_due
+
+        past_due 只在对账时计算，两次对账之间到期的借阅并未计入，
+        还书时只有对账开始前就已到期的借阅才需要扣减。
+        """
+        return self.reconciled_at is not None and due_date < self.reconciled_at
+
+    async def reconcile(self) -> int:
+        """从主库重新计算全部计数器
+
+        查询期间本进程提交的写入，其增量在结果替换 values 后重新叠加；
+        若该写入已被查询计入，会短暂多计一次，由下一次对账纠正。
+        """
+        async with self._lock:
+            started_at = datetime.now()
+            self._pending = {}
+            try:
+                # 各计数互不依赖，在多个连接上并发查询；
+                # 读主库，避免从库延迟把刚提交的写入对账掉
+                rows = await fan_out(
+                    *(query(sql, one=True) for sql in RECONCILE_QUERIES.values()),
+                    replica=False,
+                )
+                pending = self._pending
+            finally:
+                self._pending = None
+            values = {
+                name: row["value"] for name, row in zip(RECONCILE_QUERIES, rows)
+            }
+            values["total_fines"] = float(values["total_fines"])
+            for name, delta in pending.items():
+                values[name] += delta
+            self.values = values
+            self.day = date.today()
+            self.reconciled_at = started_at
+            self.dirty = False
+            return len(values)
+
+    async def snapshot(self) -> dict:
+        if self.values is None or self.dirty:
+            # 多个统计接口同时触发对账时只执行一次
+            await single_flight("counters.reconcile", None, self.reconcile)
+        self._roll_day()
+        # 增量与对账交错时可能短暂出现负数，对外输出不小于 0
+        return {name: max(value, 0) for name, value in self.values.items()}
+
+
+counters = CirculationCounters()
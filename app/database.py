@@ -1,17 +1,108 @@
+import asyncio
+import os
+import time
 import aiomysql
 from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional
 from fastapi import FastAPI
 
 DB_CONFIG = {
-    "host": "localhost",
-    "port": 3306,
-    "user": "root",
-    "password": "1Qaz@wsx",
-    "db": "library_management",
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": int(os.getenv("DB_PORT", 3306)),
+    "user": os.getenv("DB_USER", "root"),
+    "password": os.getenv("DB_PASS", "1Qaz@wsx"),
+    "db": os.getenv("DB_NAME", "library_management"),
     "autocommit": True,
 }
 
+# 只读副本，仅在设置 DB_READ_HOST 时启用，其余参数缺省沿用主库配置
+READ_DB_CONFIG = (
+    {
+        **DB_CONFIG,
+        "host": os.getenv("DB_READ_HOST"),
+        "port": int(os.getenv("DB_READ_PORT", DB_CONFIG["port"])),
+        "user": os.getenv("DB_READ_USER", DB_CONFIG["user"]),
+        "password": os.getenv("DB_READ_PASS", DB_CONFIG["password"]),
+    }
+    if os.getenv("DB_READ_HOST")
+    else None
+)
+
+# 用户写入后在该时间窗口（秒）内的读请求仍走主库，避免读到副本的延迟数据
+READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", 5))
+
+# 连接池参数，均可通过环境变量调整
+POOL_CONFIG = {
+    "minsize": int(os.getenv("DB_POOL_MINSIZE", 1)),
+    "maxsize": int(os.getenv("DB_POOL_MAXSIZE", 10)),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 3600)),
+    "connect_timeout": float(os.getenv("DB_CONNECT_TIMEOUT", 10)),
+}
+
+# 获取连接的最长等待时间（秒）
+ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", 5))
+
+# 单个请求并发执行查询时最多同时占用的连接数
+FANOUT_LIMIT = int(os.getenv("DB_FANOUT_LIMIT", 4))
+
 pool: aiomysql.Pool = None
+read_pool: aiomysql.Pool = None
+
+# 最近写入时间：读写一致性 key -> time.monotonic()
+_recent_writes: dict[str, float] = {}
+
+
+class PoolTimeoutError(Exception):
+    """在 ACQUIRE_TIMEOUT 内没有拿到连接"""
+
+
+class PoolStats:
+    """连接池获取连接的等待统计"""
+
+    # 等待时间直方图的桶上界（毫秒），最后一个桶为 +Inf
+    BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+    def __init__(self):
+        self.waiters = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.fallbacks = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.histogram = [0] * (len(self.BUCKETS) + 1)
+
+    def observe(self, wait_ms: float):
+        self.acquired += 1
+        self.wait_total_ms += wait_ms
+        self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+        for i, bound in enumerate(self.BUCKETS):
+            if wait_ms <= bound:
+                self.histogram[i] += 1
+                return
+        self.histogram[-1] += 1
+
+    def snapshot(self, target: aiomysql.Pool) -> dict:
+        labels = [f"le_{bound}ms" for bound in self.BUCKETS] + ["le_inf"]
+        return {
+            "minsize": target.minsize,
+            "maxsize": target.maxsize,
+            "size": target.size,
+            "free": target.freesize,
+            "in_use": target.size - target.freesize,
+            "waiters": self.waiters,
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "fallbacks": self.fallbacks,
+            "wait_avg_ms": round(self.wait_total_ms / self.acquired, 3)
+            if self.acquired
+            else 0.0,
+            "wait_max_ms": round(self.wait_max_ms, 3),
+            "wait_histogram": dict(zip(labels, self.histogram)),
+        }
+
+
+pool_stats = PoolStats()
+read_pool_stats = PoolStats()
 
 
 async def get_pool():
@@ -20,12 +111,151 @@ async def get_pool():
     return pool
 
 
+async def _acquire_from(target: aiomysql.Pool, stats: PoolStats):
+    stats.waiters += 1
+    start = time.perf_counter()
+    try:
+        conn = await asyncio.wait_for(target.acquire(), ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        stats.timeouts += 1
+        raise PoolTimeoutError(f"{ACQUIRE_TIMEOUT}秒内未获取到数据库连接")
+    finally:
+        stats.waiters -= 1
+    stats.observe((time.perf_counter() - start) * 1000)
+    return conn
+
+
+@asynccontextmanager
+async def acquire(replica: bool = False):
+    """从连接池获取连接，记录等待时间，超时抛出 PoolTimeoutError
+
+    replica=True 时优先使用只读副本，副本不可用时回退到主库。
+    """
+    target = await get_pool()
+    conn = None
+    if replica and read_pool is not None:
+        try:
+            conn = await _acquire_from(read_pool, read_pool_stats)
+            target = read_pool
+        except (PoolTimeoutError, aiomysql.Error, OSError):
+            read_pool_stats.fallbacks += 1
+    if conn is None:
+        conn = await _acquire_from(target, pool_stats)
+    try:
+        yield conn
+    finally:
+        await target.release(conn)
+
+
+Job = Callable[[aiomysql.Connection], Awaitable]
+
+
+class Resolved:
+    """结果已知（如命中缓存）的 fan_out 任务，直接返回 value，不占用连接"""
+
+    def __init__(self, value):
+        self.value = value
+
+
+def query(sql: str, params=None, one: bool = False) -> Job:
+    """把一条只读 SQL 包装成 fan_out 的任务，返回全部行或第一行（DictCursor）"""
+
+    async def job(conn: aiomysql.Connection):
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute(sql, params)
+            return await cursor.fetchone() if one else await cursor.fetchall()
+
+    return job
+
+
+async def fan_out(
+    *jobs: Optional[Job | Resolved], replica: bool = False, limit: int = FANOUT_LIMIT
+) -> list:
+    """在各自的池连接上并发执行一组互不依赖的只读任务，按传入顺序返回结果
+
+    每个任务是接收连接的协程函数（可用 query() 构造），传 None 时对应结果为 None，
+    传 Resolved 时直接返回其值；同时占用的连接数不超过 limit。
+    调用方不应同时持有依赖注入的连接，以免连接池被占满。
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(job: Job):
+        async with semaphore:
+            async with acquire(replica=replica) as conn:
+                return await job(conn)
+
+    async def resolved(value):
+        return value
+
+    return list(
+        await asyncio.gather(
+            *(
+                resolved(job.value if job else None)
+                if job is None or isinstance(job, Resolved)
+                else run(job)
+                for job in jobs
+            )
+        )
+    )
+
+
+def mark_write(key: str):
+    """记录某个用户（或客户端）刚刚发生过写入"""
+    if not key:
+        return
+    now = time.monotonic()
+    if len(_recent_writes) > 10000:
+        for k, ts in list(_recent_writes.items()):
+            if now - ts > READ_YOUR_WRITES_SECONDS:
+                del _recent_writes[k]
+    _recent_writes[key] = now
+
+
+def recently_wrote(key: str) -> bool:
+    """该用户是否仍在写入后的读写一致性窗口内"""
+    written_at = _recent_writes.get(key) if key else None
+    return written_at is not None and time.monotonic() - written_at <= READ_YOUR_WRITES_SECONDS
+
+
+def reads_from_replica(key: str) -> bool:
+    """该用户的读请求能否路由到只读副本"""
+    return read_pool is not None and not recently_wrote(key)
+
+
+def get_pool_stats() -> dict:
+    """连接池状态：使用中/空闲连接数、等待数与等待时间直方图"""
+    if pool is None:
+        return {}
+    stats = {"primary": pool_stats.snapshot(pool)}
+    if read_pool is not None:
+        stats["replica"] = read_pool_stats.snapshot(read_pool)
+    return stats
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global pool
-    pool = await aiomysql.create_pool(**DB_CONFIG)
-    print("数据库连接池已创建")
+    global pool, read_pool
+    pool = await aiomysql.create_pool(**DB_CONFIG, **POOL_CONFIG)
+    print(
+        f"数据库连接池已创建 (minsize={POOL_CONFIG['minsize']}, maxsize={POOL_CONFIG['maxsize']})"
+    )
+    if READ_DB_CONFIG:
+        try:
+            read_pool = await aiomysql.create_pool(**READ_DB_CONFIG, **POOL_CONFIG)
+            print(f"只读副本连接池已创建 ({READ_DB_CONFIG['host']})")
+        except Exception as e:
+            print(f"只读副本连接池创建失败，读请求将使用主库: {e}")
+
+    # scheduler 依赖本模块的连接池，放在这里导入避免循环导入
+    from .scheduler import start_background_tasks, stop_background_tasks
+
+    tasks = start_background_tasks()
     yield
+    await stop_background_tasks(tasks)
+    if read_pool is not None:
+        read_pool.close()
+        await read_pool.wait_closed()
+        read_pool = None
     pool.close()
     await pool.wait_closed()
     print("数据库连接池已关闭")
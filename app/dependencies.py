@@ -1,8 +1,10 @@
-from typing import AsyncGenerator
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Awaitable, Callable, Optional
 from aiomysql import Connection, DictCursor
-from .database import get_pool
+from .database import acquire, fan_out, reads_from_replica, PoolTimeoutError
+from .cache import user_cache, cache_user
 import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from .security import create_access_token, create_refresh_token, SECRET_KEY, ALGORITHM
 
@@ -10,12 +12,76 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
 
 async def get_conn() -> AsyncGenerator[Connection, None]:
-    # print("获取数据库连接", await get_pool())
-    async with (await get_pool()).acquire() as conn:
-        # print(await get_pool(), conn)
+    try:
+        async with acquire() as conn:
+            yield conn
+    except PoolTimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="数据库连接繁忙，请稍后重试",
+        )
+
+
+def get_token_subject(token: Optional[str]) -> Optional[str]:
+    """从访问令牌中取出用户名，令牌无效时返回 None（不抛异常）"""
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.InvalidTokenError:
+        return None
+    return payload.get("sub")
+
+
+def get_consistency_key(request: Request) -> Optional[str]:
+    """读写一致性 key：已登录用户按用户名，匿名请求按客户端地址"""
+    authorization = request.headers.get("Authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    username = get_token_subject(token) if scheme.lower() == "bearer" else None
+    if username:
+        return f"user:{username}"
+    return f"client:{request.client.host}" if request.client else None
+
+
+@asynccontextmanager
+async def read_connection(request: Request, primary: bool = False):
+    """按读写一致性规则获取只读连接，供缓存未命中时按需取连接
+
+    primary=True 时总是使用主库，用于填充所有用户共享的缓存。
+    """
+    replica = not primary and reads_from_replica(get_consistency_key(request))
+    try:
+        async with acquire(replica=replica) as conn:
+            yield conn
+    except PoolTimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="数据库连接繁忙，请稍后重试",
+        )
+
+
+async def get_read_conn(request: Request) -> AsyncGenerator[Connection, None]:
+    """只读接口使用的连接：优先只读副本，用户刚写入过时走主库"""
+    async with read_connection(request) as conn:
         yield conn
 
 
+def get_read_fanout(request: Request) -> Callable[..., Awaitable[list]]:
+    """并发只读查询：按读写一致性规则选择副本或主库，每个查询使用独立的池连接"""
+    replica = reads_from_replica(get_consistency_key(request))
+
+    async def run(*jobs) -> list:
+        try:
+            return await fan_out(*jobs, replica=replica)
+        except PoolTimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="数据库连接繁忙，请稍后重试",
+            )
+
+    return run
+
+
 async def get_user_by_username(conn, username: str) -> dict:
     async with conn.cursor(DictCursor) as cur:
         await cur.execute(
@@ -37,9 +103,8 @@ async def get_current_user(conn, user_id: int) -> dict:
 # 用户认证依赖函数 - 移到前面定义
 async def get_current_user_dependency(
     token: str = Depends(oauth2_scheme),
-    conn=Depends(get_conn),
 ) -> dict:
-    """获取当前用户依赖函数"""
+    """获取当前用户依赖函数（优先读取用户缓存，未命中时才查询数据库）"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         userName: str = payload.get("sub")
@@ -65,10 +130,21 @@ async def get_current_user_dependency(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    user = await get_user_by_username(conn, userName)
+    user = user_cache.get(("username", userName))
+    if user is None:
+        try:
+            async with acquire() as conn:
+                user = await get_user_by_username(conn, userName)
+        except PoolTimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="数据库连接繁忙，请稍后重试",
+            )
+        if user:
+            cache_user(user)
     if not user or not user.get("is_active", True):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="用户不存在或已被禁用"
         )
 
-    return user
+    return dict(user)
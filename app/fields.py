@@ -0,0 +1,28 @@
+from typing import Optional
+
+from fastapi import HTTPException
+
+
+def select_fields(
+    fields: Optional[str], columns: dict[str, str], always: tuple[str, ...] = ("id",)
+) -> Optional[dict[str, str]]:
+    """解析 fields=a,b,c 稀疏字段参数
+
+    columns 为允许的字段白名单：输出字段名 -> SELECT 表达式。返回所选字段的子集
+    （always 中的字段总是包含），未传 fields 时返回 None，未知字段返回 400。
+    """
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不支持的字段: {', '.join(unknown)}")
+    return {name: columns[name] for name in dict.fromkeys([*always, *names])}
+
+
+def select_list(columns: dict[str, str]) -> str:
+    """生成 SELECT 列表，表达式与字段名不同时加别名"""
+    return ", ".join(
+        expr if expr.rpartition(".")[2] == name else f"{expr} AS {name}"
+        for name, expr in columns.items()
+    )
@@ -1,6 +1,12 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from .database import lifespan
+from .database import lifespan, get_pool_stats, mark_write
+from .dependencies import get_consistency_key
+from .cache import get_cache_stats
+from .coalesce import get_coalesce_stats
+from .scheduler import get_job_stats
+from .stock_events import stock_broker
+from .suggest import suggest_index
 from .routers import auth, users, books, borrows
 
 app = FastAPI(
@@ -17,6 +23,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def track_writes(request: Request, call_next):
+    """记录成功的写请求，用于只读副本的读写一致性窗口"""
+    response = await call_next(request)
+    if request.method in ("POST", "PUT", "PATCH", "DELETE") and response.status_code < 400:
+        mark_write(get_consistency_key(request))
+    return response
+
+
 app.include_router(auth.router, prefix="", tags=["认证"])
 app.include_router(users.router, prefix="", tags=["用户管理"])
 app.include_router(books.router, prefix="", tags=["图书管理"])
@@ -35,7 +51,16 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "library-management-system"}
+    return {
+        "status": "healthy",
+        "service": "library-management-system",
+        "pool": get_pool_stats(),
+        "cache": get_cache_stats(),
+        "jobs": get_job_stats(),
+        "coalesce": get_coalesce_stats(),
+        "suggest": suggest_index.stats(),
+        "stock_stream": stock_broker.stats(),
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,126 @@
+import base64
+import json
+import os
+from datetime import datetime
+from enum import Enum
+from functools import partial
+from typing import Optional
+
+import aiomysql
+
+from .cache import TTLCache, register_cache
+from .database import Resolved
+
+# total_mode=cached 时 COUNT 结果的缓存容量与过期时间（秒）
+TOTAL_CACHE_SIZE = int(os.getenv("TOTAL_CACHE_SIZE", 512))
+TOTAL_CACHE_TTL = float(os.getenv("TOTAL_CACHE_TTL", 30))
+
+# total_mode=estimate 时，估算值低于该阈值说明查询范围较窄，直接精确计数
+ESTIMATE_EXACT_THRESHOLD = int(os.getenv("ESTIMATE_EXACT_THRESHOLD", 10000))
+
+total_cache = register_cache("totals", TTLCache(TOTAL_CACHE_SIZE, TOTAL_CACHE_TTL))
+
+
+class TotalMode(str, Enum):
+    EXACT = "exact"  # 每次 COUNT(*)
+    CACHED = "cached"  # 按规范化后的查询条件缓存 COUNT 结果
+    ESTIMATE = "estimate"  # 表统计信息 / EXPLAIN 估算
+    NONE = "none"  # 不返回总数（无限滚动）
+
+
+def encode_cursor(*values) -> str:
+    """把最后一行的排序键编码为不透明的游标字符串"""
+    raw = json.dumps(
+        [v.isoformat() if isinstance(v, datetime) else v for v in values],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    """解析 encode_cursor 生成的游标，格式错误时抛出 ValueError"""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    if not isinstance(values, list):
+        raise ValueError("invalid cursor")
+    return values
+
+
+async def count_total(
+    conn: aiomysql.Connection,
+    table: str,
+    from_sql: str,
+    where_clause: str,
+    params: list,
+    mode: TotalMode = TotalMode.EXACT,
+) -> Optional[int]:
+    """按 mode 计算列表总数，mode=none 时返回 None
+
+    table 为主表名，用于无过滤条件时读取表统计信息；from_sql 为 FROM 子句（可含 JOIN）。
+    """
+    if mode == TotalMode.NONE:
+        return None
+
+    count_sql = _count_sql(from_sql, where_clause)
+    if mode == TotalMode.CACHED:
+        total = total_cache.get((count_sql, tuple(params)))
+        if total is not None:
+            return total
+
+    async with conn.cursor(aiomysql.DictCursor) as cursor:
+        if mode == TotalMode.ESTIMATE:
+            if where_clause == "1=1":
+                await cursor.execute(
+                    "SELECT TABLE_ROWS AS total FROM information_schema.TABLES "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                    (table,),
+                )
+                row = await cursor.fetchone()
+                estimate = int(row["total"] or 0) if row else 0
+            else:
+                await cursor.execute(f"EXPLAIN {count_sql}", params)
+                estimate = 1.0
+                for row in await cursor.fetchall():
+                    if row.get("rows") is not None:
+                        estimate *= row["rows"] * float(row.get("filtered") or 100) / 100
+                estimate = int(estimate)
+            if estimate >= ESTIMATE_EXACT_THRESHOLD:
+                return estimate
+
+        await cursor.execute(count_sql, params)
+        total = (await cursor.fetchone())["total"]
+
+    if mode == TotalMode.CACHED:
+        total_cache.set((count_sql, tuple(params)), total)
+    return total
+
+
+def _count_sql(from_sql: str, where_clause: str) -> str:
+    return f"SELECT COUNT(*) AS total FROM {from_sql} WHERE {where_clause}"
+
+
+def total_job(
+    table: str,
+    from_sql: str,
+    where_clause: str,
+    params: list,
+    mode: TotalMode = TotalMode.EXACT,
+):
+    """把 count_total 包装成 fan_out 任务
+
+    mode=none 时返回 None，mode=cached 且命中缓存时返回 Resolved，两者都不占用连接。
+    """
+    if mode == TotalMode.NONE:
+        return None
+    if mode == TotalMode.CACHED:
+        total = total_cache.get((_count_sql(from_sql, where_clause), tuple(params)))
+        if total is not None:
+            return Resolved(total)
+    return partial(
+        count_total,
+        table=table,
+        from_sql=from_sql,
+        where_clause=where_clause,
+        params=params,
+        mode=mode,
+    )
@@ -0,0 +1,77 @@
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Iterable, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # fastapi[all] 自带 orjson，缺失时退回标准库 json
+    orjson = None
+
+# 开启后列表接口跳过 Pydantic 模型构造与 response_model 校验，直接把数据库行序列化为字节
+FAST_JSON = os.getenv("FAST_JSON", "0") == "1"
+
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    """序列化为 UTF-8 JSON 字节，datetime 输出 ISO 格式，Decimal 输出为数字"""
+    if orjson is not None:
+        return orjson.dumps(content, default=json_default)
+    return json.dumps(
+        content, ensure_ascii=False, separators=(",", ":"), default=json_default
+    ).encode()
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def json_response(content: Any, status_code: int = 200) -> Response:
+    """FAST_JSON 开启时直接序列化，否则沿用 JSONResponse + jsonable_encoder"""
+    if FAST_JSON:
+        return FastJSONResponse(content, status_code=status_code)
+    return JSONResponse(status_code=status_code, content=jsonable_encoder(content))
+
+
+def page_response(
+    response_model,
+    record_model,
+    rows: list[dict],
+    bool_fields: Optional[Iterable[str]] = None,
+    sparse: bool = False,
+    **fields,
+):
+    """分页列表响应：FAST_JSON 开启时跳过模型构造直接输出数据库行
+
+    bool_fields 为 MySQL 中以 TINYINT 存储、需要输出为 true/false 的字段；
+    sparse=True 表示只查询了部分字段（fields= 参数），同样直接输出数据库行。
+    """
+    if not (FAST_JSON or sparse):
+        return response_model(records=[record_model(**row) for row in rows], **fields)
+    if bool_fields:
+        for row in rows:
+            for name in bool_fields:
+                if row.get(name) is not None:
+                    row[name] = bool(row[name])
+    return json_response({"records": rows, **fields})
+
+
+def render(response) -> bytes:
+    """把处理函数的返回值（Response 或 Pydantic 模型）渲染为 JSON 字节，供缓存响应体"""
+    if isinstance(response, Response):
+        return response.body
+    return response.model_dump_json().encode()
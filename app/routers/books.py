@@ -1,16 +1,55 @@
 from urllib import response
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import JSONResponse
-from fastapi.encoders import jsonable_encoder
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import aiomysql
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from typing import Optional, List
+from collections import deque
 from datetime import datetime
-
-from ..dependencies import get_conn
+from email.utils import formatdate
+from enum import Enum
+import csv
+import hashlib
+import json
+import re
+
+from ..dependencies import (
+    get_conn,
+    get_read_fanout,
+    read_connection,
+    get_consistency_key,
+)
+from ..database import query, reads_from_replica, recently_wrote
+from ..cache import (
+    book_cache,
+    book_list_cache,
+    catalog_generation,
+    facet_cache,
+    invalidate_books,
+    invalidate_catalog,
+)
+from ..coalesce import single_flight
+from ..counters import counters
+from ..pagination import TotalMode, total_job, encode_cursor, decode_cursor
+from ..fields import select_fields, select_list
+from ..responses import json_response, page_response, render
+from ..streaming import ExportFormat, export_response
+from ..stock_events import STOCK_STREAM_MAX_IDS, stock_broker, stock_event_stream
+from ..suggest import suggest_index
 
 router = APIRouter()
 
+# 10 位或 13 位 ISBN（去掉连字符后）
+ISBN_PATTERN = re.compile(r"\d{9}[\dXx]|\d{13}")
+
+# 与 MySQL ngram_token_size 一致，短于该长度的关键词无法命中全文索引
+NGRAM_TOKEN_SIZE = 2
+
+
+class SearchMode(str, Enum):
+    LIKE = "like"
+    FULLTEXT = "fulltext"
+
 
 class Book(BaseModel):
     id: int
@@ -27,6 +66,12 @@ class Book(BaseModel):
     updated_at: Optional[datetime] = None
 
 
+# fields= 可选的字段（稀疏字段集）
+BOOK_COLUMNS = {name: name for name in Book.model_fields}
+
+FIELDS_DESCRIPTION = "只返回指定字段，逗号分隔，例如 fields=id,title,author"
+
+
 class BookCreate(BaseModel):
     title: str
     author: str
@@ -53,109 +98,353 @@ class BookUpdate(BaseModel):
 
 class BookResponse(BaseModel):
     records: List[Book]
-    total: int
+    total: Optional[int] = None
     current: int
     size: int
+    next_cursor: Optional[str] = None
 
 
 class BatchDeleteBooks(BaseModel):
     book_ids: List[int]
 
 
+def _build_book_filters(
+    search: Optional[str],
+    search_mode: SearchMode,
+    title: Optional[str],
+    author: Optional[str],
+    publisher: Optional[str],
+    category: Optional[str],
+):
+    """构建图书列表/导出共用的查询条件
+
+    返回 (where_clause, params, order_sql, order_params, by_relevance)，
+    by_relevance 为 True 表示按全文检索相关度排序。
+    """
+    where_conditions = []
+    params = []
+    order_sql = "created_at DESC, id DESC"
+    order_params = []
+
+    keyword = search.strip() if search else ""
+    isbn = keyword.replace("-", "").upper()
+    fulltext = search_mode == SearchMode.FULLTEXT and len(keyword) >= NGRAM_TOKEN_SIZE
+
+    # 关键词搜索（在标题、作者、ISBN中搜索）
+    if fulltext and ISBN_PATTERN.fullmatch(isbn):
+        # 输入是完整 ISBN 时直接走唯一索引
+        where_conditions.append("isbn = %s")
+        params.append(isbn)
+        fulltext = False
+    elif fulltext:
+        # 全文索引（ngram 分词），按相关度排序
+        match_sql = "MATCH(title, author) AGAINST (%s IN NATURAL LANGUAGE MODE)"
+        where_conditions.append(match_sql)
+        params.append(keyword)
+        order_sql = f"{match_sql} DESC, id DESC"
+        order_params.append(keyword)
+    elif search:
+        where_conditions.append("(title LIKE %s OR author LIKE %s OR isbn LIKE %s)")
+        search_param = f"%{search}%"
+        params.extend([search_param, search_param, search_param])
+
+    # 按标题搜索
+    if title:
+        where_conditions.append("title LIKE %s")
+        params.append(f"%{title}%")
+
+    # 按作者搜索
+    if author:
+        where_conditions.append("author LIKE %s")
+        params.append(f"%{author}%")
+
+    # 按出版社搜索
+    if publisher:
+        where_conditions.append("publisher LIKE %s")
+        params.append(f"%{publisher}%")
+
+    # 按分类精确匹配
+    if category:
+        where_conditions.append("category = %s")
+        params.append(category)
+
+    where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
+    return where_clause, params, order_sql, order_params, fulltext
+
+
 @router.get("/books", response_model=BookResponse)
 async def get_books(
+    request: Request,
     current: int = Query(1, ge=1),
     size: int = Query(10, ge=1, le=100),
     search: Optional[str] = Query(None),
+    search_mode: SearchMode = Query(
+        SearchMode.LIKE, description="like：模糊匹配；fulltext：全文索引，按相关度排序"
+    ),
     title: Optional[str] = Query(None),
     author: Optional[str] = Query(None),
     publisher: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
-    conn: aiomysql.Connection = Depends(get_conn),
+    after: Optional[str] = Query(
+        None,
+        alias="cursor",
+        description="游标分页：首页传空字符串，之后传上一页返回的 next_cursor",
+    ),
+    total_mode: Optional[TotalMode] = Query(
+        None,
+        description="总数计算方式：exact 精确、cached 短时缓存、estimate 估算、none 不返回；"
+        "默认页码分页为 exact，游标分页为 none",
+    ),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    fetch=Depends(get_read_fanout),
 ):
-    """获取图书列表，支持分页和多条件搜索"""
-    try:
-        async with conn.cursor(aiomysql.DictCursor) as cursor:
-            # 构建查询条件
-            where_conditions = []
-            params = []
+    """获取图书列表，支持页码/游标分页、多条件搜索和稀疏字段
+
+    响应体按（目录版本号, 读主库还是副本, 规范化的查询参数）缓存，图书或库存变化后
+    版本号递增，旧结果不再命中。
+    """
+    selected = select_fields(fields, BOOK_COLUMNS)
+    if total_mode is None:
+        # 游标分页本就是为了避免扫描，默认不计算总数
+        total_mode = TotalMode.NONE if after is not None else TotalMode.EXACT
+    # 版本号必须在查询之前读取，查询期间发生的写入会使本次结果直接过期；
+    # 读写一致性窗口内的请求走主库，不能命中或加入读副本的结果
+    cache_key = (
+        catalog_generation(),
+        reads_from_replica(get_consistency_key(request)),
+        search,
+        search_mode.value,
+        title,
+        author,
+        publisher,
+        category,
+        after,
+        current if after is None else None,
+        size,
+        total_mode.value,
+        tuple(selected) if selected else None,
+    )
+    body = book_list_cache.get(cache_key)
+    if body is not None:
+        return Response(content=body, media_type="application/json")
+
+    async def load() -> bytes:
+        columns = dict(selected or BOOK_COLUMNS)
+        # 游标分页需要 created_at 生成下一页游标，未请求时查询后再去掉
+        strip_created_at = after is not None and "created_at" not in columns
+        if strip_created_at:
+            columns["created_at"] = "created_at"
+        seek = None
+        if after:
+            try:
+                created_at, last_id = decode_cursor(after)
+                seek = (datetime.fromisoformat(created_at), int(last_id))
+            except (ValueError, TypeError):
+                raise HTTPException(status_code=400, detail="无效的游标")
+        where_clause, params, order_sql, order_params, by_relevance = _build_book_filters(
+            search, search_mode, title, author, publisher, category
+        )
+        if by_relevance and after is not None:
+            raise HTTPException(status_code=400, detail="全文搜索按相关度排序，不支持游标分页")
+        try:
+            select_sql = f"SELECT {select_list(columns)} FROM books"
+            if after is not None:
+                # 游标分页：按 (created_at, id) 定位，翻页深度不影响查询代价
+                seek_clause = where_clause
+                seek_params = list(params)
+                if seek:
+                    seek_clause += " AND (created_at < %s OR (created_at = %s AND id < %s))"
+                    seek_params.extend([seek[0], seek[0], seek[1]])
+                data_sql = f"""
+                    {select_sql}
+                    WHERE {seek_clause}
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s
+                """
+                # 多取一行用于判断是否还有下一页
+                data_params = seek_params + [size + 1]
+            else:
+                # 页码分页
+                offset = (current - 1) * size
+                data_sql = f"""
+                    {select_sql}
+                    WHERE {where_clause}
+                    ORDER BY {order_sql}
+                    LIMIT %s OFFSET %s
+                """
+                data_params = params + order_params + [size, offset]
+
+            # 总数与当前页互不依赖，在两个连接上并发查询
+            total, books = await fetch(
+                total_job("books", "books", where_clause, params, total_mode),
+                query(data_sql, data_params),
+            )
 
-            # 全文搜索（在标题、作者、ISBN中搜索）
-            if search:
-                where_conditions.append(
-                    "(title LIKE %s OR author LIKE %s OR isbn LIKE %s)"
+            next_cursor = None
+            if after is not None and len(books) > size:
+                books = books[:size]
+                next_cursor = encode_cursor(books[-1]["created_at"], books[-1]["id"])
+            if strip_created_at:
+                for book in books:
+                    del book["created_at"]
+
+            body = render(
+                page_response(
+                    BookResponse,
+                    Book,
+                    books,
+                    sparse=selected is not None,
+                    total=total,
+                    current=current,
+                    size=size,
+                    next_cursor=next_cursor,
                 )
-                search_param = f"%{search}%"
-                params.extend([search_param, search_param, search_param])
-
-            # 按标题搜索
-            if title:
-                where_conditions.append("title LIKE %s")
-                params.append(f"%{title}%")
-
-            # 按作者搜索
-            if author:
-                where_conditions.append("author LIKE %s")
-                params.append(f"%{author}%")
-
-            # 按出版社搜索
-            if publisher:
-                where_conditions.append("publisher LIKE %s")
-                params.append(f"%{publisher}%")
-
-            # 按分类精确匹配
-            if category:
-                where_conditions.append("category = %s")
-                params.append(category)
-
-            where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
-
-            # 获取总数
-            count_sql = f"SELECT COUNT(*) as total FROM books WHERE {where_clause}"
-            await cursor.execute(count_sql, params)
-            total_result = await cursor.fetchone()
-            total = total_result["total"]
-
-            # 获取分页数据
-            offset = (current - 1) * size
-            data_sql = f"""
-                SELECT id, title, author, isbn, publisher, publish_date, category,
-                       price, stock_quantity, description, created_at, updated_at
-                FROM books
-                WHERE {where_clause}
-                ORDER BY created_at DESC
-                LIMIT %s OFFSET %s
-            """
-            await cursor.execute(data_sql, params + [size, offset])
-            books = await cursor.fetchall()
-
-            return BookResponse(
-                records=[Book(**book) for book in books],
-                total=total,
-                current=current,
-                size=size,
             )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"获取图书列表失败: {str(e)}")
+            book_list_cache.set(cache_key, body)
+            return body
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"获取图书列表失败: {str(e)}")
+
+    # 相同查询的并发请求（缓存未命中时）只查询一次数据库
+    body = await single_flight("get_books", cache_key, load)
+    return Response(content=body, media_type="application/json")
+
+
+@router.get("/books/export")
+async def export_books(
+    request: Request,
+    file_format: ExportFormat = Query(ExportFormat.NDJSON, alias="format"),
+    search: Optional[str] = Query(None),
+    search_mode: SearchMode = Query(SearchMode.LIKE),
+    title: Optional[str] = Query(None),
+    author: Optional[str] = Query(None),
+    publisher: Optional[str] = Query(None),
+    category: Optional[str] = Query(None),
+):
+    """导出图书目录（NDJSON/CSV 流式输出，筛选条件与图书列表相同）"""
+    where_clause, params, order_sql, order_params, _ = _build_book_filters(
+        search, search_mode, title, author, publisher, category
+    )
+    sql = f"""
+        SELECT id, title, author, isbn, publisher, publish_date, category,
+               price, stock_quantity, description, created_at, updated_at
+        FROM books
+        WHERE {where_clause}
+        ORDER BY {order_sql}
+    """
+    return export_response(
+        sql,
+        params + order_params,
+        file_format,
+        "books",
+        replica=reads_from_replica(get_consistency_key(request)),
+    )
+
+
+@router.get("/books/suggest")
+async def suggest_books(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+):
+    """搜索框联想：书名、作者、ISBN 前缀匹配，支持拼音全拼和首字母（如 hlm -> 红楼梦）
 
+    查询内存前缀索引，不访问数据库；索引启动时构建，图书增删改时增量更新。
+    """
+    return json_response({"suggestions": suggest_index.search(q, limit)})
 
-@router.get("/books/{book_id}", response_model=Book)
-async def get_book(book_id: int, conn: aiomysql.Connection = Depends(get_conn)):
-    """获取单本图书详情"""
+
+@router.get("/books/stock/stream")
+async def stream_book_stock(
+    ids: str = Query(..., description="逗号分隔的图书ID，如 1,2,3"),
+):
+    """订阅图书库存变化（Server-Sent Events）
+
+    连接后先推送各图书的当前库存，之后借书、还书、修改或删除图书时推送
+    `event: stock`，data 为 {"book_id", "stock_quantity"}（图书已删除时库存为 null）；
+    空闲时每隔一段时间发送心跳注释。
+    """
     try:
-        async with conn.cursor(aiomysql.DictCursor) as cursor:
-            sql = """
-                SELECT id, title, author, isbn, publisher, publish_date, category,
-                       price, stock_quantity, description, created_at, updated_at
-                FROM books WHERE id = %s
-            """
-            await cursor.execute(sql, (book_id,))
-            book = await cursor.fetchone()
+        book_ids = list(dict.fromkeys(int(v) for v in ids.split(",") if v.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="图书ID格式错误")
+    if not book_ids or len(book_ids) > STOCK_STREAM_MAX_IDS:
+        raise HTTPException(
+            status_code=400, detail=f"需要订阅 1 到 {STOCK_STREAM_MAX_IDS} 本图书"
+        )
+    return StreamingResponse(
+        stock_event_stream(book_ids),
+        media_type="text/event-stream",
+        # 禁止 nginx 等反向代理缓冲事件流
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _fetch_book(conn: aiomysql.Connection, book_id: int) -> Optional[dict]:
+    """读取图书详情缓存条目，未命中时查询数据库并写入缓存；图书不存在时返回 None"""
+    entry = book_cache.get(book_id)
+    if entry is not None:
+        return entry
+    async with conn.cursor(aiomysql.DictCursor) as cursor:
+        await cursor.execute(
+            f"SELECT {select_list(BOOK_COLUMNS)} FROM books WHERE id = %s", (book_id,)
+        )
+        row = await cursor.fetchone()
+    if not row:
+        return None
+    body = Book(**row).model_dump_json().encode()
+    entry = {
+        "row": row,
+        "body": body,
+        # 内容哈希随 updated_at 和库存等任何字段变化
+        "etag": f'"{book_id}-{hashlib.sha1(body).hexdigest()[:16]}"',
+        "last_modified": formatdate(row["updated_at"].timestamp(), usegmt=True)
+        if row["updated_at"]
+        else None,
+    }
+    book_cache.set(book_id, entry)
+    return entry
 
-            if not book:
-                raise HTTPException(status_code=404, detail="图书不存在")
 
-            return Book(**book)
+@router.get("/books/{book_id}", response_model=Book)
+async def get_book(
+    book_id: int,
+    request: Request,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    if_none_match: Optional[str] = Header(None),
+):
+    """获取单本图书详情
+
+    图书行缓存在进程内，响应带 ETag/Last-Modified；缓存命中且 If-None-Match 匹配时
+    直接返回 304，不查询数据库。
+    """
+    selected = select_fields(fields, BOOK_COLUMNS)
+    try:
+        # 读写一致性窗口内的用户不读缓存（缓存可能由其他 worker 写入前填充），查主库并刷新
+        fresh = recently_wrote(get_consistency_key(request))
+        if fresh:
+            book_cache.pop(book_id)
+        entry = book_cache.get(book_id)
+        if entry is None:
+            # 缓存由所有用户共享，只用主库数据填充，避免缓存副本的延迟数据
+            async with read_connection(request, primary=True) as conn:
+                entry = await _fetch_book(conn, book_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="图书不存在")
+
+        headers = {"ETag": entry["etag"], "Cache-Control": "no-cache"}
+        if entry["last_modified"]:
+            headers["Last-Modified"] = entry["last_modified"]
+        if _etag_matches(if_none_match, entry["etag"]):
+            return Response(status_code=304, headers=headers)
+        if selected:
+            response = json_response({name: entry["row"][name] for name in selected})
+            response.headers.update(headers)
+            return response
+        return Response(
+            content=entry["body"], media_type="application/json", headers=headers
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -199,10 +488,18 @@ async def create_book(
             # 获取新创建的图书ID
             book_id = cursor.lastrowid
             await conn.commit()
-            response = await get_book(book_id, conn)
-            # 将响应转换为JSON格式
+            invalidate_catalog()
+            counters.add(books=1)
+            # 用写连接读回刚写入的行，同时填充详情缓存
+            entry = await _fetch_book(conn, book_id)
+            suggest_index.upsert([entry["row"]])
             # 返回创建的图书信息
-            return JSONResponse(status_code=201, content=jsonable_encoder(response))
+            return Response(
+                status_code=201,
+                content=entry["body"],
+                media_type="application/json",
+                headers={"ETag": entry["etag"]},
+            )
     except HTTPException:
         raise
     except Exception as e:
@@ -247,9 +544,18 @@ async def update_book(
             params.append(book_id)
             await cursor.execute(sql, params)
             await conn.commit()
-
-            # 返回更新后的图书信息
-            return await get_book(book_id, conn)
+            invalidate_catalog()
+            invalidate_books([book_id])
+            stock_broker.publish([book_id])
+
+            # 返回更新后的图书信息（用写连接读回，同时刷新详情缓存）
+            entry = await _fetch_book(conn, book_id)
+            suggest_index.upsert([entry["row"]])
+            return Response(
+                content=entry["body"],
+                media_type="application/json",
+                headers={"ETag": entry["etag"]},
+            )
     except HTTPException:
         raise
     except Exception as e:
@@ -272,6 +578,11 @@ async def delete_book(book_id: int, conn: aiomysql.Connection = Depends(get_conn
             sql = "DELETE FROM books WHERE id = %s"
             await cursor.execute(sql, (book_id,))
             await conn.commit()
+            invalidate_catalog()
+            invalidate_books([book_id])
+            suggest_index.remove([book_id])
+            stock_broker.publish([book_id])
+            counters.invalidate()
 
             return JSONResponse(status_code=204, content=None)
     except HTTPException:
@@ -281,36 +592,68 @@ async def delete_book(book_id: int, conn: aiomysql.Connection = Depends(get_conn
         raise HTTPException(status_code=500, detail=f"删除图书失败: {str(e)}")
 
 
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否命中当前 ETag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+async def _facet_response(
+    request: Request, column: str, key: str, if_none_match: Optional[str]
+) -> Response:
+    """返回某个字段的去重值列表及每个值的图书数量，结果缓存并带强 ETag"""
+    entry = facet_cache.get(column)
+    if entry is None:
+        # 缓存由所有用户共享（且带强 ETag），只用主库数据填充
+        async with read_connection(request, primary=True) as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(
+                    f"""
+                    SELECT {column} AS value, COUNT(*) AS count
+                    FROM books
+                    WHERE {column} IS NOT NULL
+                    GROUP BY {column}
+                    ORDER BY {column}
+                    """
+                )
+                rows = await cursor.fetchall()
+        body = json.dumps(
+            {key: [row["value"] for row in rows], "facets": rows},
+            ensure_ascii=False,
+        ).encode()
+        entry = {"body": body, "etag": f'"{hashlib.sha1(body).hexdigest()}"'}
+        facet_cache.set(column, entry)
+
+    headers = {"ETag": entry["etag"], "Cache-Control": "no-cache"}
+    if _etag_matches(if_none_match, entry["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(
+        content=entry["body"], media_type="application/json", headers=headers
+    )
+
+
 @router.get("/books/categories/list")
-async def get_categories(conn: aiomysql.Connection = Depends(get_conn)):
-    """获取所有图书分类"""
+async def get_categories(
+    request: Request, if_none_match: Optional[str] = Header(None)
+):
+    """获取所有图书分类（含每个分类的图书数量）"""
     try:
-        async with conn.cursor(aiomysql.DictCursor) as cursor:
-            sql = "SELECT DISTINCT category FROM books WHERE category IS NOT NULL ORDER BY category"
-            await cursor.execute(sql)
-            categories = await cursor.fetchall()
-
-            return JSONResponse(
-                status_code=200,
-                content={"categories": [cat["category"] for cat in categories]},
-            )
+        return await _facet_response(request, "category", "categories", if_none_match)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取分类列表失败: {str(e)}")
 
 
 @router.get("/books/authors/list")
-async def get_authors(conn: aiomysql.Connection = Depends(get_conn)):
-    """获取所有作者"""
+async def get_authors(request: Request, if_none_match: Optional[str] = Header(None)):
+    """获取所有作者（含每位作者的图书数量）"""
     try:
-        async with conn.cursor(aiomysql.DictCursor) as cursor:
-            sql = "SELECT DISTINCT author FROM books WHERE author IS NOT NULL ORDER BY author"
-            await cursor.execute(sql)
-            authors = await cursor.fetchall()
-
-            return JSONResponse(
-                status_code=200,
-                content={"authors": [author["author"] for author in authors]},
-            )
+        return await _facet_response(request, "author", "authors", if_none_match)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取作者列表失败: {str(e)}")
 
@@ -339,6 +682,11 @@ async def batch_delete_books(
             delete_sql = "DELETE FROM books WHERE id IN %s"
             await cursor.execute(delete_sql, (tuple(book_ids),))
             await conn.commit()
+            invalidate_catalog()
+            invalidate_books(book_ids)
+            suggest_index.remove(book_ids)
+            stock_broker.publish(book_ids)
+            counters.invalidate()
 
             return JSONResponse(status_code=204, content=None)
     except HTTPException:
@@ -346,3 +694,265 @@ async def batch_delete_books(
     except Exception as e:
         await conn.rollback()
         raise HTTPException(status_code=500, detail=f"批量删除图书失败: {str(e)}")
+
+
+class ImportFormat(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+
+
+# 批量导入写入的列，created_at/updated_at 使用表默认值，
+# 这样 executemany 可以改写成多行 INSERT
+IMPORT_COLUMNS = (
+    "title",
+    "author",
+    "isbn",
+    "publisher",
+    "publish_date",
+    "category",
+    "price",
+    "stock_quantity",
+    "description",
+)
+
+# 导入报告中最多返回的错误行数
+IMPORT_MAX_ERRORS = 1000
+
+
+async def _iter_lines(request: Request):
+    """逐行读取流式上传的请求体，不把整个文件读入内存
+
+    产出未解码、保留行尾换行符的字节，由调用方逐行解码，单行编码错误不会中断整个导入。
+    """
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line + b"\n"
+    if buffer:
+        yield buffer
+
+
+class _NeedMoreLines(Exception):
+    pass
+
+
+class _CsvLineFeed:
+    """csv.reader 的输入：按需吐出已读到的行，记录当前记录已消费的行
+
+    请求体是异步流，csv.reader 只能同步取行。记录跨行（引号内有换行）而下一行尚未
+    读到时抛出 _NeedMoreLines，调用方把已消费的行放回，读到新行后由同一个 reader
+    重新解析这条记录。
+    """
+
+    def __init__(self):
+        self.lines = deque()
+        self.record = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            raise _NeedMoreLines
+        line = self.lines.popleft()
+        self.record.append(line)
+        return line
+
+    def rewind(self):
+        self.lines.extendleft(reversed(self.record))
+        self.record = []
+
+
+def _decode_line(line: bytes):
+    """返回 (文本, 解码错误)；解码失败时用替换字符解码，保证引号仍能正确配对"""
+    try:
+        return line.decode("utf-8-sig"), None
+    except UnicodeDecodeError as e:
+        return line.decode("utf-8-sig", errors="replace"), e
+
+
+async def _iter_import_rows(request: Request, file_format: ImportFormat):
+    """产出 (行号, 原始数据 dict 或 None, 解析错误)
+
+    NDJSON 每行一条记录；CSV 由一个 csv.reader 解析，引号内的字段可以跨行，
+    行号为记录的起始行。
+    """
+    if file_format == ImportFormat.NDJSON:
+        line_no = 0
+        async for line in _iter_lines(request):
+            line_no += 1
+            if not line.strip():
+                continue
+            try:
+                # UnicodeDecodeError 是 ValueError 的子类，记为该行的解析错误
+                row = json.loads(line.decode("utf-8-sig"))
+                if not isinstance(row, dict):
+                    raise ValueError("每行必须是一个 JSON 对象")
+            except ValueError as e:
+                yield line_no, None, f"解析失败: {e}"
+                continue
+            yield line_no, row, None
+        return
+
+    feed = _CsvLineFeed()
+    reader = csv.reader(feed)
+    header = None
+    line_no = 0
+    record_start = None  # 未解析完的记录的起始行号
+    record_error = None
+    async for line in _iter_lines(request):
+        line_no += 1
+        if record_start is None:
+            if not line.strip():
+                continue
+            record_start = line_no
+        text, error = _decode_line(line)
+        record_error = record_error or error
+        feed.lines.append(text)
+        try:
+            values = next(reader)
+        except _NeedMoreLines:
+            feed.rewind()
+            continue
+        except csv.Error as e:
+            values, record_error = None, record_error or e
+        start, error = record_start, record_error
+        feed.record, record_start, record_error = [], None, None
+        if error:
+            yield start, None, f"解析失败: {error}"
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        yield start, {
+            name: (value if value != "" else None)
+            for name, value in zip(header, values)
+        }, None
+    if record_start is not None:
+        yield record_start, None, "解析失败: 引号内的字段未结束"
+
+
+def _isbn_key(isbn: str) -> str:
+    """ISBN 的比较 key：utf8mb4_unicode_ci 下大小写和尾部空格不同的值视为相同"""
+    return isbn.strip().upper()
+
+
+async def _write_import_batch(conn, batch: list, report: dict):
+    """写入一批已校验的图书：先按 ISBN 去重，再在一个事务里多行 INSERT
+
+    多行 INSERT 因唯一键冲突失败时（如与并发写入的图书重复），回滚后逐行插入，
+    只有冲突的行记为失败。
+    """
+    async with conn.cursor(aiomysql.DictCursor) as cursor:
+        await cursor.execute(
+            "SELECT isbn FROM books WHERE isbn IN %s",
+            (tuple({book.isbn for _, book in batch}),),
+        )
+        existing = {_isbn_key(row["isbn"]) for row in await cursor.fetchall()}
+
+        pending = []
+        for line_no, book in batch:
+            if _isbn_key(book.isbn) in existing:
+                _add_import_error(report, line_no, book.isbn, "ISBN已存在")
+            else:
+                pending.append((line_no, book))
+        if not pending:
+            return
+
+        sql = f"""
+            INSERT INTO books ({", ".join(IMPORT_COLUMNS)})
+            VALUES ({", ".join(["%s"] * len(IMPORT_COLUMNS))})
+        """
+        rows = [
+            tuple(getattr(book, column) for column in IMPORT_COLUMNS)
+            for _, book in pending
+        ]
+        try:
+            await conn.begin()
+            await cursor.executemany(sql, rows)
+            await conn.commit()
+            report["inserted"] += len(rows)
+            return
+        except aiomysql.IntegrityError:
+            await conn.rollback()
+        except Exception as e:
+            await conn.rollback()
+            for line_no, book in pending:
+                _add_import_error(report, line_no, book.isbn, f"写入失败: {str(e)}")
+            return
+
+        for (line_no, book), row in zip(pending, rows):
+            try:
+                await cursor.execute(sql, row)
+                report["inserted"] += 1
+            except aiomysql.IntegrityError:
+                _add_import_error(report, line_no, book.isbn, "ISBN已存在")
+            except Exception as e:
+                _add_import_error(report, line_no, book.isbn, f"写入失败: {str(e)}")
+
+
+def _add_import_error(report: dict, line_no: Optional[int], isbn, message: str):
+    report["failed"] += 1
+    if len(report["errors"]) < IMPORT_MAX_ERRORS:
+        report["errors"].append({"line": line_no, "isbn": isbn, "error": message})
+
+
+@router.post("/books/import")
+async def import_books(
+    request: Request,
+    file_format: ImportFormat = Query(
+        ImportFormat.CSV, alias="format", description="csv（首行为表头）或 ndjson"
+    ),
+    batch_size: int = Query(1000, ge=1, le=10000, description="每个事务写入的行数"),
+    conn: aiomysql.Connection = Depends(get_conn),
+):
+    """批量导入图书
+
+    请求体为流式上传的 CSV 或 NDJSON，逐行按 BookCreate 校验，按 ISBN 去重后
+    分批多行 INSERT，每批一个事务，返回逐行错误报告。CSV 引号内的字段可以换行。
+    """
+    report = {"total": 0, "inserted": 0, "failed": 0, "errors": []}
+    batch = []
+    batch_isbns = set()
+    try:
+        async for line_no, row, error in _iter_import_rows(request, file_format):
+            report["total"] += 1
+            isbn = row.get("isbn") if row else None
+            if error:
+                _add_import_error(report, line_no, isbn, error)
+                continue
+            try:
+                book = BookCreate(**row)
+            except ValidationError as e:
+                message = "; ".join(
+                    f"{'.'.join(map(str, err['loc']))}: {err['msg']}"
+                    for err in e.errors()
+                )
+                _add_import_error(report, line_no, isbn, message)
+                continue
+            book.isbn = book.isbn.strip()
+            # 跨批次的重复由下一批写入前的 ISBN 查询发现
+            if _isbn_key(book.isbn) in batch_isbns:
+                _add_import_error(report, line_no, book.isbn, "文件内ISBN重复")
+                continue
+            batch.append((line_no, book))
+            batch_isbns.add(_isbn_key(book.isbn))
+            if len(batch) >= batch_size:
+                await _write_import_batch(conn, batch, report)
+                batch = []
+                batch_isbns = set()
+        if batch:
+            await _write_import_batch(conn, batch, report)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"批量导入图书失败: {str(e)}")
+    finally:
+        if report["inserted"]:
+            invalidate_catalog()
+            # 逐行插入有序数组会长时间阻塞事件循环，导入后在后台整体重建联想索引
+            suggest_index.schedule_rebuild()
+            counters.add(books=report["inserted"])
+
+    report["errors_truncated"] = report["failed"] > len(report["errors"])
+    return JSONResponse(status_code=200, content={"message": "导入完成", **report})
@@ -1,13 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.encoders import jsonable_encoder
 import aiomysql
 from pydantic import BaseModel
 from typing import Optional, List
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from enum import Enum
 
-from ..dependencies import get_conn, get_current_user_dependency
+from ..dependencies import (
+    get_conn,
+    get_read_conn,
+    get_read_fanout,
+    get_current_user_dependency,
+    get_consistency_key,
+    read_connection,
+)
+from ..cache import invalidate_books
+from ..counters import counters
+from ..database import query, reads_from_replica
+from ..pagination import TotalMode, decode_cursor, encode_cursor, total_job
+from ..fields import select_fields, select_list
+from ..responses import json_response, page_response
+from ..stock_events import stock_broker
+from ..streaming import ExportFormat, export_response, stream_query
 
 router = APIRouter()
 
@@ -19,6 +34,20 @@ class BorrowStatus(str, Enum):
     RENEWED = "renewed"
 
 
+class Granularity(str, Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+
+
+# 各粒度下汇总周期起始日的表达式（周从周一开始）
+PERIOD_SQL = {
+    Granularity.DAY: "day",
+    Granularity.WEEK: "DATE_SUB(day, INTERVAL WEEKDAY(day) DAY)",
+    Granularity.MONTH: "DATE_FORMAT(day, '%%Y-%%m-01')",
+}
+
+
 class Borrow(BaseModel):
     id: int
     user_id: int
@@ -53,6 +82,42 @@ class BorrowWithDetails(BaseModel):
     days_overdue: Optional[int] = None
 
 
+# fields= 可选的字段（稀疏字段集）：输出字段名 -> SELECT 表达式
+BORROW_COLUMNS = {
+    "id": "b.id",
+    "user_id": "b.user_id",
+    "user_name": "u.username",
+    "user_email": "u.email",
+    "book_id": "b.book_id",
+    "book_title": "bk.title",
+    "book_author": "bk.author",
+    "book_isbn": "bk.isbn",
+    "borrow_date": "b.borrow_date",
+    "due_date": "b.due_date",
+    "return_date": "b.return_date",
+    "status": "b.status",
+    "renewal_count": "b.renewal_count",
+    "fine_amount": "b.fine_amount",
+    "notes": "b.notes",
+    "days_overdue": (
+        "CASE WHEN b.due_date < NOW() AND b.status IN ('borrowed', 'overdue') "
+        "THEN DATEDIFF(NOW(), b.due_date) ELSE NULL END"
+    ),
+}
+
+FIELDS_DESCRIPTION = "只返回指定字段，逗号分隔，例如 fields=id,book_title,due_date"
+
+
+def _borrow_from_sql(columns: dict[str, str], search: Optional[str] = None) -> str:
+    """只 JOIN 所选字段或搜索条件用到的表，外键保证关联行存在，不影响结果行数"""
+    from_sql = "borrows b"
+    if search or any(expr.startswith("u.") for expr in columns.values()):
+        from_sql += " JOIN users u ON b.user_id = u.id"
+    if search or any(expr.startswith("bk.") for expr in columns.values()):
+        from_sql += " JOIN books bk ON b.book_id = bk.id"
+    return from_sql
+
+
 class BorrowCreate(BaseModel):
     user_id: Optional[int] = None  # 如果是管理员，可以指定用户ID
     book_id: int
@@ -60,6 +125,13 @@ class BorrowCreate(BaseModel):
     notes: Optional[str] = None
 
 
+class BorrowBatchCreate(BaseModel):
+    user_id: Optional[int] = None  # 如果是管理员，可以指定用户ID
+    book_ids: List[int]
+    borrow_days: int = 30
+    notes: Optional[str] = None
+
+
 class BorrowReturn(BaseModel):
     notes: Optional[str] = None
 
@@ -69,13 +141,63 @@ class BorrowRenewal(BaseModel):
     notes: Optional[str] = None
 
 
+class BorrowBatchReturn(BaseModel):
+    borrow_ids: List[int]
+    notes: Optional[str] = None
+
+
+class BorrowBatchRenewal(BaseModel):
+    borrow_ids: List[int]
+    renewal_days: int = 30
+    notes: Optional[str] = None
+
+
 class BorrowResponse(BaseModel):
     records: List[BorrowWithDetails]
-    total: int
+    total: Optional[int] = None
     current: int
     size: int
 
 
+def _build_borrow_filters(
+    current_user: dict,
+    user_id: Optional[int],
+    book_id: Optional[int],
+    status: Optional[BorrowStatus],
+    search: Optional[str],
+    overdue_only: bool,
+):
+    """构建借阅列表/导出共用的查询条件，返回 (where_clause, params)"""
+    where_conditions = ["1=1"]
+    params = []
+    if current_user.get("is_admin", True):
+        if user_id:
+            where_conditions.append("b.user_id = %s")
+            params.append(user_id)
+    else:
+        where_conditions.append("b.user_id = %s")
+        params.append(current_user["id"])
+    if book_id:
+        where_conditions.append("b.book_id = %s")
+        params.append(book_id)
+
+    if status:
+        where_conditions.append("b.status = %s")
+        params.append(status.value)
+
+    if search:
+        where_conditions.append(
+            "(u.username LIKE %s OR bk.title LIKE %s OR bk.author LIKE %s)"
+        )
+        search_param = f"%{search}%"
+        params.extend([search_param, search_param, search_param])
+
+    if overdue_only:
+        where_conditions.append("b.due_date < NOW() AND b.status IN ('borrowed', 'overdue')")
+
+    return " AND ".join(where_conditions), params
+
+
 @router.get("/borrows", response_model=BorrowResponse)
 async def get_borrows(
     page: int = Query(1, ge=1),
@@ -85,104 +207,104 @@ async def get_borrows(
     status: Optional[BorrowStatus] = Query(None),
     search: Optional[str] = Query(None, description="搜索用户名、图书标题或作者"),
     overdue_only: bool = Query(False, description="只显示逾期记录"),
-    conn: aiomysql.Connection = Depends(get_conn),
+    total_mode: TotalMode = Query(
+        TotalMode.EXACT,
+        description="总数计算方式：exact 精确、cached 短时缓存、estimate 估算、none 不返回",
+    ),
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    fetch=Depends(get_read_fanout),
     current_user: dict = Depends(get_current_user_dependency),
 ):
     """获取借阅记录列表"""
+    selected = select_fields(fields, BORROW_COLUMNS)
+    columns = selected or BORROW_COLUMNS
     try:
         offset = (page - 1) * page_size
 
         # 构建查询条件
-        where_conditions = ["1=1"]
-        params = []
-        if current_user.get("is_admin", True):
-            if user_id:
-                where_conditions.append("b.user_id = %s")
-                params.append(user_id)
-        else:
-            where_conditions.append("b.user_id = %s")
-            params.append(current_user["id"])
-        if book_id:
-            where_conditions.append("b.book_id = %s")
-            params.append(book_id)
-
-        if status:
-            where_conditions.append("b.status = %s")
-            params.append(status.value)
-
-        if search:
-            where_conditions.append(
-                "(u.username LIKE %s OR bk.title LIKE %s OR bk.author LIKE %s)"
-            )
-            search_param = f"%{search}%"
-            params.extend([search_param, search_param, search_param])
-
-        if overdue_only:
-            where_conditions.append("b.due_date < NOW() AND b.status = 'borrowed'")
-
-        where_clause = " AND ".join(where_conditions)
-
-        async with conn.cursor(aiomysql.DictCursor) as cursor:
-            # 查询总数
-            count_sql = f"""
-                SELECT COUNT(*) as total
-                FROM borrows b
-                JOIN users u ON b.user_id = u.id
-                JOIN books bk ON b.book_id = bk.id
-                WHERE {where_clause}
-            """
-            await cursor.execute(count_sql, params)
-            total = (await cursor.fetchone())["total"]
-
-            # 查询数据
-            data_sql = f"""
-                SELECT b.id, b.user_id, u.username as user_name, u.email as user_email,
-                       b.book_id, bk.title as book_title, bk.author as book_author, bk.isbn as book_isbn,
-                       b.borrow_date, b.due_date, b.return_date, b.status, b.renewal_count,
-                       b.fine_amount, b.notes,
-                       CASE
-                           WHEN b.due_date < NOW() AND b.status = 'borrowed'
-                           THEN DATEDIFF(NOW(), b.due_date)
-                           ELSE NULL
-                       END as days_overdue
-                FROM borrows b
-                JOIN users u ON b.user_id = u.id
-                JOIN books bk ON b.book_id = bk.id
-                WHERE {where_clause}
-                ORDER BY b.borrow_date DESC
-                LIMIT %s OFFSET %s
-            """
-            await cursor.execute(data_sql, params + [page_size, offset])
-            borrows = await cursor.fetchall()
-
-            return BorrowResponse(
-                records=[BorrowWithDetails(**borrow) for borrow in borrows],
-                total=total,
-                current=page,
-                size=page_size,
-            )
+        where_clause, params = _build_borrow_filters(
+            current_user, user_id, book_id, status, search, overdue_only
+        )
+
+        # 查询总数：没有按用户名/书名搜索时无需 JOIN
+        count_from = _borrow_from_sql({}, search)
+        data_sql = f"""
+            SELECT {select_list(columns)}
+            FROM {_borrow_from_sql(columns, search)}
+            WHERE {where_clause}
+            ORDER BY b.borrow_date DESC
+            LIMIT %s OFFSET %s
+        """
+        # 总数与当前页数据并发查询
+        total, borrows = await fetch(
+            total_job("borrows", count_from, where_clause, params, total_mode),
+            query(data_sql, params + [page_size, offset]),
+        )
+
+        return page_response(
+            BorrowResponse,
+            BorrowWithDetails,
+            borrows,
+            sparse=selected is not None,
+            total=total,
+            current=page,
+            size=page_size,
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取借阅记录失败: {str(e)}")
 
 
+@router.get("/borrows/export")
+async def export_borrows(
+    request: Request,
+    file_format: ExportFormat = Query(ExportFormat.NDJSON, alias="format"),
+    user_id: Optional[int] = Query(None),
+    book_id: Optional[int] = Query(None),
+    status: Optional[BorrowStatus] = Query(None),
+    search: Optional[str] = Query(None, description="搜索用户名、图书标题或作者"),
+    overdue_only: bool = Query(False, description="只显示逾期记录"),
+    current_user: dict = Depends(get_current_user_dependency),
+):
+    """导出借阅记录（NDJSON/CSV 流式输出，筛选条件与借阅列表相同）"""
+    where_clause, params = _build_borrow_filters(
+        current_user, user_id, book_id, status, search, overdue_only
+    )
+    sql = f"""
+        SELECT b.id, b.user_id, u.username as user_name, u.email as user_email,
+               b.book_id, bk.title as book_title, bk.author as book_author, bk.isbn as book_isbn,
+               b.borrow_date, b.due_date, b.return_date, b.status, b.renewal_count,
+               b.fine_amount, b.notes
+        FROM borrows b
+        JOIN users u ON b.user_id = u.id
+        JOIN books bk ON b.book_id = bk.id
+        WHERE {where_clause}
+        ORDER BY b.id
+    """
+    return export_response(
+        sql,
+        params,
+        file_format,
+        "borrows",
+        replica=reads_from_replica(get_consistency_key(request)),
+    )
+
+
 @router.get("/borrows/{borrow_id}", response_model=BorrowWithDetails)
-async def get_borrow(borrow_id: int, conn: aiomysql.Connection = Depends(get_conn)):
+async def get_borrow(
+    borrow_id: int,
+    fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION),
+    conn: aiomysql.Connection = Depends(get_read_conn),
+):
     """获取单条借阅记录详情"""
+    selected = select_fields(fields, BORROW_COLUMNS)
+    columns = selected or BORROW_COLUMNS
     try:
         async with conn.cursor(aiomysql.DictCursor) as cursor:
-            sql = """
-                SELECT b.id, b.user_id, u.username as user_name, u.email as user_email,
-                       b.book_id, bk.title as book_title, bk.author as book_author, bk.isbn as book_isbn,
-                       b.borrow_date, b.due_date, b.return_date, b.status, b.renewal_count,
-                       b.fine_amount, b.notes,
-                       CASE
-                           WHEN b.due_date < NOW() AND b.status = 'borrowed'
-                           THEN DATEDIFF(NOW(), b.due_date)
-                           ELSE NULL
-                       END as days_overdue
-                FROM borrows b
-                JOIN users u ON b.user_id = u.id
-                JOIN books bk ON b.book_id = bk.id
+            sql = f"""
+                SELECT {select_list(columns)}
+                FROM {_borrow_from_sql(columns)}
                 WHERE b.id = %s
             """
             await cursor.execute(sql, (borrow_id,))
@@ -191,28 +313,64 @@ async def get_borrow(borrow_id: int, conn: aiomysql.Connection = Depends(get_con
             if not borrow:
                 raise HTTPException(status_code=404, detail="借阅记录不存在")
 
-            return BorrowWithDetails(**borrow)
+            return json_response(borrow) if selected else BorrowWithDetails(**borrow)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取借阅记录失败: {str(e)}")
 
 
+# 每位用户同时在借的最大数量
+MAX_ACTIVE_BORROWS = 5
+
+# 未归还的借阅状态（逾期记录由后台任务从 borrowed 标记为 overdue）
+ACTIVE_STATUSES = (BorrowStatus.BORROWED.value, BorrowStatus.OVERDUE.value)
+
+# 每笔借阅最多续借次数
+MAX_RENEWALS = 2
+
+
+def calculate_fine(due_date: datetime, return_date: datetime) -> float:
+    """计算罚金（逾期每天1元）"""
+    if return_date > due_date:
+        overdue_days = (return_date - due_date).days
+        return overdue_days * 1.0
+    return 0.0
+
+
+def _case_by_id(column_values: dict) -> tuple[str, list]:
+    """生成 CASE id WHEN ... THEN ... END 表达式，用一条 UPDATE 为每行写入不同的值"""
+    sql = "CASE id " + " ".join(["WHEN %s THEN %s"] * len(column_values)) + " END"
+    params = [item for pair in column_values.items() for item in pair]
+    return sql, params
+
+
 @router.post("/borrows/borrow")
 async def borrow_book(
     borrow_data: BorrowCreate,
     conn: aiomysql.Connection = Depends(get_conn),
     current_user: dict = Depends(get_current_user_dependency),
 ):
-    """借书"""
+    """借书
+
+    在一个显式事务中完成检查与扣减库存：先锁定用户行（同一用户的借书请求串行，
+    借阅上限不会被并发绕过），再用带条件的 UPDATE 扣减库存（库存不会变为负数）。
+    只锁用户行，不对 borrows 加锁读，避免间隙锁与其他用户的 INSERT 互相等待而死锁。
+    """
+    if not borrow_data.user_id:
+        # 如果是普通用户，使用当前用户ID
+        borrow_data.user_id = current_user["id"]
+    borrow_date = datetime.now()
+    due_date = borrow_date + timedelta(days=borrow_data.borrow_days)
+
     try:
         async with conn.cursor(aiomysql.DictCursor) as cursor:
-            if not borrow_data.user_id:
-                # 如果是普通用户，使用当前用户ID
-                borrow_data.user_id = current_user["id"]
-            # 检查用户是否存在且可用
+            await conn.begin()
+
+            # 锁定用户行，同一用户的借书请求在此串行
             await cursor.execute(
-                "SELECT id, is_active FROM users WHERE id = %s", (borrow_data.user_id,)
+                "SELECT is_active FROM users WHERE id = %s FOR UPDATE",
+                (borrow_data.user_id,),
             )
             user = await cursor.fetchone()
             if not user:
@@ -220,38 +378,37 @@ async def borrow_book(
             if not user["is_active"]:
                 raise HTTPException(status_code=400, detail="用户账户已被禁用")
 
-            # 检查图书是否存在且有库存
-            await cursor.execute(
-                "SELECT id, title, stock_quantity FROM books WHERE id = %s",
-                (borrow_data.book_id,),
-            )
-            book = await cursor.fetchone()
-            if not book:
-                raise HTTPException(status_code=404, detail="图书不存在")
-            if book["stock_quantity"] <= 0:
-                raise HTTPException(status_code=400, detail="图书库存不足")
-
-            # 检查用户是否已借阅此书且未归还
+            # 普通读：一致性快照在拿到用户行锁之后才建立，能看到前一个持锁事务提交的借阅
             await cursor.execute(
-                "SELECT id FROM borrows WHERE user_id = %s AND book_id = %s AND status = 'borrowed'",
-                (borrow_data.user_id, borrow_data.book_id),
+                """
+                SELECT COUNT(*) AS borrowed_count, IFNULL(SUM(book_id = %s), 0) AS has_book
+                FROM borrows
+                WHERE user_id = %s AND status IN ('borrowed', 'overdue')
+                """,
+                (borrow_data.book_id, borrow_data.user_id),
             )
-            if await cursor.fetchone():
+            loans = await cursor.fetchone()
+            if loans["has_book"]:
                 raise HTTPException(status_code=400, detail="用户已借阅此书，请先归还")
+            if loans["borrowed_count"] >= MAX_ACTIVE_BORROWS:
+                raise HTTPException(
+                    status_code=400, detail=f"借阅数量已达上限（{MAX_ACTIVE_BORROWS}本）"
+                )
 
-            # 检查用户当前借阅数量（限制为5本）
+            # 有库存时才扣减
             await cursor.execute(
-                "SELECT COUNT(*) as count FROM borrows WHERE user_id = %s AND status = 'borrowed'",
-                (borrow_data.user_id,),
+                "UPDATE books SET stock_quantity = stock_quantity - 1 WHERE id = %s AND stock_quantity > 0",
+                (borrow_data.book_id,),
             )
-            current_borrows = (await cursor.fetchone())["count"]
-            if current_borrows >= 5:
-                raise HTTPException(status_code=400, detail="借阅数量已达上限（5本）")
+            if cursor.rowcount == 0:
+                await cursor.execute(
+                    "SELECT id FROM books WHERE id = %s", (borrow_data.book_id,)
+                )
+                if not await cursor.fetchone():
+                    raise HTTPException(status_code=404, detail="图书不存在")
+                raise HTTPException(status_code=400, detail="图书库存不足")
 
             # 创建借阅记录
-            borrow_date = datetime.now()
-            due_date = borrow_date + timedelta(days=borrow_data.borrow_days)
-
             await cursor.execute(
                 """
                 INSERT INTO borrows (user_id, book_id, borrow_date, due_date, status, notes, created_at, updated_at)
@@ -265,16 +422,12 @@ async def borrow_book(
                     borrow_data.notes,
                 ),
             )
-
             borrow_id = cursor.lastrowid
 
-            # 减少图书库存
-            # await cursor.execute(
-            #     "UPDATE books SET stock_quantity = stock_quantity - 1 WHERE id = %s",
-            #     (borrow_data.book_id,)
-            # )
-
             await conn.commit()
+            invalidate_books([borrow_data.book_id])
+            stock_broker.publish([borrow_data.book_id])
+            counters.add(borrows=1, borrowed=1, today_borrows=1)
 
             return JSONResponse(
                 status_code=201,
@@ -285,12 +438,131 @@ async def borrow_book(
                 },
             )
     except HTTPException:
+        await conn.rollback()
         raise
     except Exception as e:
         await conn.rollback()
         raise HTTPException(status_code=500, detail=f"借书失败: {str(e)}")
 
 
+@router.post("/borrows/borrow/batch")
+async def batch_borrow_books(
+    borrow_data: BorrowBatchCreate,
+    conn: aiomysql.Connection = Depends(get_conn),
+    current_user: dict = Depends(get_current_user_dependency),
+):
+    """一次借多本书
+
+    在一个事务中统一校验（库存、重复借阅、整批计入的借阅上限），
+    可借的图书用一条多行 INSERT 写入，返回每本书的借阅结果。
+    """
+    if not borrow_data.book_ids:
+        raise HTTPException(status_code=400, detail="没有提供要借阅的图书ID列表")
+    user_id = borrow_data.user_id or current_user["id"]
+    borrow_date = datetime.now()
+    due_date = borrow_date + timedelta(days=borrow_data.borrow_days)
+
+    try:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await conn.begin()
+
+            # 只锁定用户行（不对 borrows 加锁读，避免间隙锁死锁），再普通读出其在借图书
+            await cursor.execute(
+                "SELECT is_active FROM users WHERE id = %s FOR UPDATE", (user_id,)
+            )
+            user = await cursor.fetchone()
+            if not user:
+                raise HTTPException(status_code=404, detail="用户不存在")
+            if not user["is_active"]:
+                raise HTTPException(status_code=400, detail="用户账户已被禁用")
+            await cursor.execute(
+                "SELECT book_id FROM borrows WHERE user_id = %s AND status IN ('borrowed', 'overdue')",
+                (user_id,),
+            )
+            borrowed = {row["book_id"] for row in await cursor.fetchall()}
+            remaining = MAX_ACTIVE_BORROWS - len(borrowed)
+
+            # 按 ID 顺序锁定图书行，避免并发批量借书时死锁
+            await cursor.execute(
+                "SELECT id, stock_quantity FROM books WHERE id IN %s ORDER BY id FOR UPDATE",
+                (tuple(set(borrow_data.book_ids)),),
+            )
+            stock = {row["id"]: row["stock_quantity"] for row in await cursor.fetchall()}
+
+            results = []
+            accepted = []
+            seen = set()
+            for book_id in borrow_data.book_ids:
+                if book_id in seen:
+                    error = "重复的图书ID"
+                elif book_id not in stock:
+                    error = "图书不存在"
+                elif book_id in borrowed:
+                    error = "用户已借阅此书，请先归还"
+                elif stock[book_id] <= 0:
+                    error = "图书库存不足"
+                elif len(accepted) >= remaining:
+                    error = f"借阅数量已达上限（{MAX_ACTIVE_BORROWS}本）"
+                else:
+                    error = None
+                    accepted.append(book_id)
+                seen.add(book_id)
+                results.append({"book_id": book_id, "success": error is None, "error": error})
+
+            if not accepted:
+                await conn.rollback()
+                return JSONResponse(
+                    status_code=400,
+                    content={"message": "没有可借阅的图书", "results": results},
+                )
+
+            await cursor.execute(
+                "UPDATE books SET stock_quantity = stock_quantity - 1 WHERE id IN %s",
+                (tuple(accepted),),
+            )
+            # created_at/updated_at 使用表默认值，executemany 会改写为一条多行 INSERT
+            await cursor.executemany(
+                """
+                INSERT INTO borrows (user_id, book_id, borrow_date, due_date, status, notes)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                """,
+                [
+                    (user_id, book_id, borrow_date, due_date, "borrowed", borrow_data.notes)
+                    for book_id in accepted
+                ],
+            )
+            await cursor.execute(
+                "SELECT id, book_id FROM borrows WHERE user_id = %s AND book_id IN %s AND status = 'borrowed'",
+                (user_id, tuple(accepted)),
+            )
+            borrow_ids = {row["book_id"]: row["id"] for row in await cursor.fetchall()}
+
+            await conn.commit()
+            invalidate_books(accepted)
+            stock_broker.publish(accepted)
+            counters.add(
+                borrows=len(accepted), borrowed=len(accepted), today_borrows=len(accepted)
+            )
+
+            for result in results:
+                if result["success"]:
+                    result["borrow_id"] = borrow_ids.get(result["book_id"])
+                    result["due_date"] = due_date.isoformat()
+            return JSONResponse(
+                status_code=201,
+                content={
+                    "message": f"成功借阅{len(accepted)}本，失败{len(results) - len(accepted)}本",
+                    "results": results,
+                },
+            )
+    except HTTPException:
+        await conn.rollback()
+        raise
+    except Exception as e:
+        await conn.rollback()
+        raise HTTPException(status_code=500, detail=f"批量借书失败: {str(e)}")
+
+
 @router.post("/borrows/{borrow_id}/return")
 async def return_book(
     borrow_id: int,
@@ -302,7 +574,7 @@ async def return_book(
         async with conn.cursor(aiomysql.DictCursor) as cursor:
             # 获取借阅记录
             await cursor.execute(
-                "SELECT * FROM borrows WHERE id = %s AND status = 'borrowed'",
+                "SELECT * FROM borrows WHERE id = %s AND status IN ('borrowed', 'overdue')",
                 (borrow_id,),
             )
             borrow = await cursor.fetchone()
@@ -312,11 +584,7 @@ async def return_book(
 
             # 计算罚金（逾期每天1元）
             return_date = datetime.now()
-            fine_amount = 0.0
-
-            if return_date > borrow["due_date"]:
-                overdue_days = (return_date - borrow["due_date"]).days
-                fine_amount = overdue_days * 1.0  # 每天1元罚金
+            fine_amount = calculate_fine(borrow["due_date"], return_date)
 
             # 更新借阅记录
             await cursor.execute(
@@ -341,6 +609,16 @@ async def return_book(
             # )
 
             await conn.commit()
+            # 库存由还书触发器增加
+            invalidate_books([borrow["book_id"]])
+            stock_broker.publish([borrow["book_id"]])
+            counters.add(
+                borrowed=-(borrow["status"] == "borrowed"),
+                overdue=-(borrow["status"] == "overdue"),
+                past_due=-counters.counted_past_due(borrow["due_date"]),
+                today_returns=1,
+                total_fines=fine_amount,
+            )
 
             return JSONResponse(
                 status_code=200,
@@ -368,7 +646,7 @@ async def renew_book(
         async with conn.cursor(aiomysql.DictCursor) as cursor:
             # 获取借阅记录
             await cursor.execute(
-                "SELECT * FROM borrows WHERE id = %s AND status = 'borrowed'",
+                "SELECT * FROM borrows WHERE id = %s AND status IN ('borrowed', 'overdue')",
                 (borrow_id,),
             )
             borrow = await cursor.fetchone()
@@ -377,8 +655,10 @@ async def renew_book(
                 raise HTTPException(status_code=404, detail="借阅记录不存在或已归还")
 
             # 检查续借次数限制（最多续借2次）
-            if borrow["renewal_count"] >= 2:
-                raise HTTPException(status_code=400, detail="续借次数已达上限（2次）")
+            if borrow["renewal_count"] >= MAX_RENEWALS:
+                raise HTTPException(
+                    status_code=400, detail=f"续借次数已达上限（{MAX_RENEWALS}次）"
+                )
 
             # 检查是否逾期（逾期不能续借）
             if datetime.now() > borrow["due_date"]:
@@ -422,114 +702,440 @@ async def renew_book(
         raise HTTPException(status_code=500, detail=f"续借失败: {str(e)}")
 
 
-@router.get("/borrows/user/{user_id}")
-async def get_user_borrows(
-    user_id: int,
-    status: Optional[BorrowStatus] = Query(None),
+async def _lock_borrows(cursor, borrow_ids: List[int]) -> dict:
+    """一次 IN 查询读取并锁定一批借阅记录"""
+    await cursor.execute(
+        """
+        SELECT id, book_id, due_date, status, renewal_count
+        FROM borrows WHERE id IN %s
+        FOR UPDATE
+        """,
+        (tuple(set(borrow_ids)),),
+    )
+    return {row["id"]: row for row in await cursor.fetchall()}
+
+
+@router.post("/borrows/batch-return")
+async def batch_return_books(
+    return_data: BorrowBatchReturn,
     conn: aiomysql.Connection = Depends(get_conn),
 ):
-    """获取用户的借阅记录"""
+    """批量还书：一次查询读取全部借阅记录，统一计算罚金，在一个事务中更新"""
+    if not return_data.borrow_ids:
+        raise HTTPException(status_code=400, detail="没有提供要归还的借阅ID列表")
+    return_date = datetime.now()
     try:
         async with conn.cursor(aiomysql.DictCursor) as cursor:
-            where_clause = "b.user_id = %s"
-            params = [user_id]
-
-            if status:
-                where_clause += " AND b.status = %s"
-                params.append(status.value)
+            await conn.begin()
+            borrows = await _lock_borrows(cursor, return_data.borrow_ids)
+
+            results = []
+            fines = {}
+            for borrow_id in return_data.borrow_ids:
+                borrow = borrows.get(borrow_id)
+                if borrow_id in fines:
+                    error = "重复的借阅ID"
+                elif not borrow or borrow["status"] not in ACTIVE_STATUSES:
+                    error = "借阅记录不存在或已归还"
+                else:
+                    error = None
+                    fines[borrow_id] = calculate_fine(borrow["due_date"], return_date)
+                results.append(
+                    {
+                        "borrow_id": borrow_id,
+                        "success": error is None,
+                        "error": error,
+                        "fine_amount": fines.get(borrow_id, 0.0) if error is None else 0.0,
+                    }
+                )
 
-            sql = f"""
-                SELECT b.id, b.book_id, bk.title as book_title, bk.author as book_author,
-                       b.borrow_date, b.due_date, b.return_date, b.status, b.renewal_count,
-                       b.fine_amount, b.notes,
-                       CASE
-                           WHEN b.due_date < NOW() AND b.status = 'borrowed'
-                           THEN DATEDIFF(NOW(), b.due_date)
-                           ELSE NULL
-                       END as days_overdue
-                FROM borrows b
-                JOIN books bk ON b.book_id = bk.id
-                WHERE {where_clause}
-                ORDER BY b.borrow_date DESC
-            """
-            await cursor.execute(sql, params)
-            borrows = await cursor.fetchall()
+            if fines:
+                fine_sql, fine_params = _case_by_id(fines)
+                await cursor.execute(
+                    f"""
+                    UPDATE borrows
+                    SET return_date = %s, status = 'returned', fine_amount = {fine_sql},
+                        notes = CONCAT(IFNULL(notes, ''), %s), updated_at = NOW()
+                    WHERE id IN %s
+                    """,
+                    [
+                        return_date,
+                        *fine_params,
+                        f" [归还备注: {return_data.notes}]" if return_data.notes else "",
+                        tuple(fines),
+                    ],
+                )
+            await conn.commit()
+            returned = [borrows[borrow_id] for borrow_id in fines]
+            returned_book_ids = [b["book_id"] for b in returned]
+            invalidate_books(returned_book_ids)
+            stock_broker.publish(returned_book_ids)
+            counters.add(
+                borrowed=-sum(b["status"] == "borrowed" for b in returned),
+                overdue=-sum(b["status"] == "overdue" for b in returned),
+                past_due=-sum(counters.counted_past_due(b["due_date"]) for b in returned),
+                today_returns=len(returned),
+                total_fines=sum(fines.values()),
+            )
 
-            return JSONResponse(status_code=200, content={"borrows": borrows})
+            return JSONResponse(
+                status_code=200,
+                content={
+                    "message": f"成功归还{len(fines)}本，失败{len(results) - len(fines)}本",
+                    "return_date": return_date.isoformat(),
+                    "total_fine": sum(fines.values()),
+                    "results": results,
+                },
+            )
+    except HTTPException:
+        await conn.rollback()
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"获取用户借阅记录失败: {str(e)}")
+        await conn.rollback()
+        raise HTTPException(status_code=500, detail=f"批量还书失败: {str(e)}")
 
 
-@router.get("/borrows/stats/summary")
-async def get_borrow_stats(conn: aiomysql.Connection = Depends(get_conn)):
-    """获取借阅统计信息"""
+@router.post("/borrows/batch-renew")
+async def batch_renew_books(
+    renewal_data: BorrowBatchRenewal,
+    conn: aiomysql.Connection = Depends(get_conn),
+):
+    """批量续借：一次查询读取全部借阅记录，在一个事务中更新到期时间"""
+    if not renewal_data.borrow_ids:
+        raise HTTPException(status_code=400, detail="没有提供要续借的借阅ID列表")
+    now = datetime.now()
     try:
         async with conn.cursor(aiomysql.DictCursor) as cursor:
-            # 当前借阅中的图书数量
-            await cursor.execute(
-                "SELECT COUNT(*) as count FROM borrows WHERE status = 'borrowed'"
-            )
-            current_borrows = (await cursor.fetchone())["count"]
+            await conn.begin()
+            borrows = await _lock_borrows(cursor, renewal_data.borrow_ids)
+
+            results = []
+            due_dates = {}
+            for borrow_id in renewal_data.borrow_ids:
+                borrow = borrows.get(borrow_id)
+                if borrow_id in due_dates:
+                    error = "重复的借阅ID"
+                elif not borrow or borrow["status"] not in ACTIVE_STATUSES:
+                    error = "借阅记录不存在或已归还"
+                elif borrow["renewal_count"] >= MAX_RENEWALS:
+                    error = f"续借次数已达上限（{MAX_RENEWALS}次）"
+                elif now > borrow["due_date"]:
+                    error = "图书已逾期，不能续借，请先归还"
+                else:
+                    error = None
+                    due_dates[borrow_id] = borrow["due_date"] + timedelta(
+                        days=renewal_data.renewal_days
+                    )
+                result = {"borrow_id": borrow_id, "success": error is None, "error": error}
+                if error is None:
+                    result["new_due_date"] = due_dates[borrow_id].isoformat()
+                    result["renewal_count"] = borrow["renewal_count"] + 1
+                results.append(result)
+
+            if due_dates:
+                due_sql, due_params = _case_by_id(due_dates)
+                await cursor.execute(
+                    f"""
+                    UPDATE borrows
+                    SET due_date = {due_sql}, renewal_count = renewal_count + 1,
+                        notes = CONCAT(IFNULL(notes, ''), %s), updated_at = NOW()
+                    WHERE id IN %s
+                    """,
+                    [
+                        *due_params,
+                        f" [续借备注: {renewal_data.notes}]" if renewal_data.notes else "",
+                        tuple(due_dates),
+                    ],
+                )
+            await conn.commit()
 
-            # 逾期图书数量
-            await cursor.execute(
-                "SELECT COUNT(*) as count FROM borrows WHERE status = 'borrowed' AND due_date < NOW()"
+            return JSONResponse(
+                status_code=200,
+                content={
+                    "message": f"成功续借{len(due_dates)}本，失败{len(results) - len(due_dates)}本",
+                    "results": results,
+                },
             )
-            overdue_borrows = (await cursor.fetchone())["count"]
+    except HTTPException:
+        await conn.rollback()
+        raise
+    except Exception as e:
+        await conn.rollback()
+        raise HTTPException(status_code=500, detail=f"批量续借失败: {str(e)}")
 
-            # 今日借阅数量
-            await cursor.execute(
-                "SELECT COUNT(*) as count FROM borrows WHERE DATE(borrow_date) = CURDATE()"
-            )
-            today_borrows = (await cursor.fetchone())["count"]
 
-            # 今日归还数量
-            await cursor.execute(
-                "SELECT COUNT(*) as count FROM borrows WHERE DATE(return_date) = CURDATE()"
-            )
-            today_returns = (await cursor.fetchone())["count"]
+@router.get("/borrows/user/{user_id}")
+async def get_user_borrows(
+    request: Request,
+    user_id: int,
+    status: Optional[BorrowStatus] = Query(None),
+    size: int = Query(20, ge=1, le=100),
+    after: Optional[str] = Query(
+        None, alias="cursor", description="上一页返回的 next_cursor，首页不传"
+    ),
+    stream: bool = Query(False, description="以 NDJSON 流式返回全部记录（忽略分页参数）"),
+):
+    """获取用户的借阅记录
+
+    按 (borrow_date, id) 倒序游标分页，stream=true 时以 NDJSON 流式返回全部记录。
+    """
+    where_clause = "b.user_id = %s"
+    params = [user_id]
+    if status:
+        where_clause += " AND b.status = %s"
+        params.append(status.value)
+
+    select_sql = """
+        SELECT b.id, b.book_id, bk.title as book_title, bk.author as book_author,
+               b.borrow_date, b.due_date, b.return_date, b.status, b.renewal_count,
+               b.fine_amount, b.notes,
+               CASE
+                   WHEN b.due_date < NOW() AND b.status IN ('borrowed', 'overdue')
+                   THEN DATEDIFF(NOW(), b.due_date)
+                   ELSE NULL
+               END as days_overdue
+        FROM borrows b
+        JOIN books bk ON b.book_id = bk.id
+    """
+    if stream:
+        return StreamingResponse(
+            stream_query(
+                f"{select_sql} WHERE {where_clause} ORDER BY b.borrow_date DESC, b.id DESC",
+                params,
+                ExportFormat.NDJSON,
+                reads_from_replica(get_consistency_key(request)),
+            ),
+            media_type="application/x-ndjson",
+        )
+
+    if after:
+        try:
+            borrow_date, last_id = decode_cursor(after)
+            seek = (datetime.fromisoformat(borrow_date), int(last_id))
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="无效的游标")
+        # (user_id, borrow_date) 索引上的范围扫描，翻页深度不影响查询代价
+        where_clause += " AND (b.borrow_date < %s OR (b.borrow_date = %s AND b.id < %s))"
+        params.extend([seek[0], seek[0], seek[1]])
+
+    try:
+        async with read_connection(request) as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                # 多取一行用于判断是否还有下一页
+                await cursor.execute(
+                    f"""
+                    {select_sql}
+                    WHERE {where_clause}
+                    ORDER BY b.borrow_date DESC, b.id DESC
+                    LIMIT %s
+                    """,
+                    params + [size + 1],
+                )
+                borrows = await cursor.fetchall()
 
-            # 总罚金
+        next_cursor = None
+        if len(borrows) > size:
+            borrows = borrows[:size]
+            next_cursor = encode_cursor(borrows[-1]["borrow_date"], borrows[-1]["id"])
+        return json_response({"borrows": borrows, "next_cursor": next_cursor})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取用户借阅记录失败: {str(e)}")
+
+
+@router.get("/borrows/stats/summary")
+async def get_borrow_stats():
+    """获取借阅统计信息（读取内存中的统计计数器，不查询 borrows 表）"""
+    try:
+        values = await counters.snapshot()
+        return JSONResponse(
+            status_code=200,
+            content={
+                "current_borrows": values["borrowed"] + values["overdue"],
+                "overdue_borrows": values["past_due"],
+                "today_borrows": values["today_borrows"],
+                "today_returns": values["today_returns"],
+                "total_fines": round(values["total_fines"], 2),
+            },
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取借阅统计失败: {str(e)}")
+
+
+@router.get("/borrows/stats/analytics")
+async def get_borrow_analytics(
+    start: Optional[date] = Query(None, description="开始日期（含），默认30天前"),
+    end: Optional[date] = Query(None, description="结束日期（含），默认今天"),
+    granularity: Granularity = Query(Granularity.DAY, description="day / week / month"),
+    category: Optional[str] = Query(None, description="只统计该分类"),
+    conn: aiomysql.Connection = Depends(get_read_conn),
+):
+    """借阅趋势：按日/周/月返回借出、归还、逾期数和罚金
+
+    数据来自后台任务维护的 borrow_daily_rollups 日汇总表，不扫描 borrows。
+    """
+    end = end or date.today()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=400, detail="开始日期不能晚于结束日期")
+
+    where_clause = "day >= %s AND day <= %s"
+    params = [start, end]
+    if category:
+        where_clause += " AND category = %s"
+        params.append(category)
+    try:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
             await cursor.execute(
-                "SELECT IFNULL(SUM(fine_amount), 0) as total FROM borrows WHERE fine_amount > 0"
+                f"""
+                SELECT {PERIOD_SQL[granularity]} AS period,
+                       SUM(borrows) AS borrows, SUM(returns) AS returns,
+                       SUM(overdue) AS overdue, SUM(fines) AS fines
+                FROM borrow_daily_rollups
+                WHERE {where_clause}
+                GROUP BY period
+                ORDER BY period
+                """,
+                params,
             )
-            total_fines = (await cursor.fetchone())["total"]
+            rows = await cursor.fetchall()
 
             return JSONResponse(
                 status_code=200,
                 content={
-                    "current_borrows": current_borrows,
-                    "overdue_borrows": overdue_borrows,
-                    "today_borrows": today_borrows,
-                    "today_returns": today_returns,
-                    "total_fines": float(total_fines),
+                    "start": start.isoformat(),
+                    "end": end.isoformat(),
+                    "granularity": granularity.value,
+                    "category": category,
+                    "series": [
+                        {
+                            "period": str(row["period"]),
+                            "borrows": int(row["borrows"]),
+                            "returns": int(row["returns"]),
+                            "overdue": int(row["overdue"]),
+                            "fines": float(row["fines"]),
+                        }
+                        for row in rows
+                    ],
                 },
             )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"获取借阅统计失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"获取借阅趋势失败: {str(e)}")
+
+
+OVERDUE_SELECT_SQL = """
+    SELECT b.id, b.user_id, u.username, u.email, u.phone,
+           b.book_id, bk.title as book_title, bk.author as book_author, bk.category,
+           b.borrow_date, b.due_date, b.renewal_count,
+           DATEDIFF(NOW(), b.due_date) as days_overdue
+    FROM borrows b
+    JOIN users u ON b.user_id = u.id
+    JOIN books bk ON b.book_id = bk.id
+"""
+
+
+def _build_overdue_filters(
+    min_days: Optional[int], max_days: Optional[int], category: Optional[str]
+) -> tuple[str, list]:
+    """逾期列表的筛选条件（不含 status），逾期天数换算为 due_date 范围以便走索引"""
+    today = datetime.combine(date.today(), datetime.min.time())
+    where_conditions = ["b.due_date < %s"]
+    params = [datetime.now()]
+    if min_days:
+        # DATEDIFF(NOW(), due_date) >= min_days
+        where_conditions.append("b.due_date < %s")
+        params.append(today - timedelta(days=min_days - 1))
+    if max_days is not None:
+        # DATEDIFF(NOW(), due_date) <= max_days
+        where_conditions.append("b.due_date >= %s")
+        params.append(today - timedelta(days=max_days))
+    if category:
+        where_conditions.append("bk.category = %s")
+        params.append(category)
+    return " AND ".join(where_conditions), params
 
 
 @router.get("/borrows/overdue/list")
-async def get_overdue_borrows(conn: aiomysql.Connection = Depends(get_conn)):
-    """获取逾期借阅列表"""
+async def get_overdue_borrows(
+    min_days: Optional[int] = Query(None, ge=1, description="最少逾期天数"),
+    max_days: Optional[int] = Query(None, ge=0, description="最多逾期天数"),
+    category: Optional[str] = Query(None, description="图书分类"),
+    size: int = Query(50, ge=1, le=500),
+    after: Optional[str] = Query(
+        None, alias="cursor", description="上一页返回的 next_cursor，首页不传"
+    ),
+    conn: aiomysql.Connection = Depends(get_read_conn),
+):
+    """获取逾期借阅列表
+
+    按 (due_date, id) 升序游标分页，可按逾期天数区间和图书分类筛选。
+    """
+    where_clause, params = _build_overdue_filters(min_days, max_days, category)
+    if after:
+        try:
+            due_date, last_id = decode_cursor(after)
+            seek = (datetime.fromisoformat(due_date), int(last_id))
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="无效的游标")
+        where_clause += " AND (b.due_date > %s OR (b.due_date = %s AND b.id > %s))"
+        params.extend([seek[0], seek[0], seek[1]])
+
+    # 两种状态分别沿 (status, due_date) 索引有序读取前 size+1 行再合并，
+    # 避免 status IN (...) 时对全部逾期记录排序
+    branch_sql = f"""
+        ({OVERDUE_SELECT_SQL}
+         WHERE b.status = %s AND {where_clause}
+         ORDER BY b.due_date, b.id
+         LIMIT %s)
+    """
+    sql = f"""
+        {branch_sql}
+        UNION ALL
+        {branch_sql}
+        ORDER BY due_date, id
+        LIMIT %s
+    """
     try:
         async with conn.cursor(aiomysql.DictCursor) as cursor:
-            sql = """
-                SELECT b.id, b.user_id, u.username, u.email, u.phone,
-                       b.book_id, bk.title as book_title, bk.author as book_author,
-                       b.borrow_date, b.due_date, b.renewal_count,
-                       DATEDIFF(NOW(), b.due_date) as days_overdue
-                FROM borrows b
-                JOIN users u ON b.user_id = u.id
-                JOIN books bk ON b.book_id = bk.id
-                WHERE b.status = 'borrowed' AND b.due_date < NOW()
-                ORDER BY b.due_date ASC
-            """
-            await cursor.execute(sql)
+            await cursor.execute(
+                sql,
+                ["overdue", *params, size + 1, "borrowed", *params, size + 1, size + 1],
+            )
             overdue_borrows = await cursor.fetchall()
 
-            return JSONResponse(
-                status_code=200, content={"overdue_borrows": overdue_borrows}
+            next_cursor = None
+            if len(overdue_borrows) > size:
+                overdue_borrows = overdue_borrows[:size]
+                next_cursor = encode_cursor(
+                    overdue_borrows[-1]["due_date"], overdue_borrows[-1]["id"]
+                )
+            return json_response(
+                {"overdue_borrows": overdue_borrows, "next_cursor": next_cursor}
             )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取逾期列表失败: {str(e)}")
+
+
+@router.get("/borrows/overdue/export")
+async def export_overdue_borrows(
+    request: Request,
+    file_format: ExportFormat = Query(ExportFormat.CSV, alias="format"),
+    min_days: Optional[int] = Query(None, ge=1, description="最少逾期天数"),
+    max_days: Optional[int] = Query(None, ge=0, description="最多逾期天数"),
+    category: Optional[str] = Query(None, description="图书分类"),
+):
+    """导出逾期借阅（默认 CSV，流式输出，用于打印催还通知）"""
+    where_clause, params = _build_overdue_filters(min_days, max_days, category)
+    sql = f"""
+        {OVERDUE_SELECT_SQL}
+        WHERE b.status IN ('borrowed', 'overdue') AND {where_clause}
+        ORDER BY b.due_date, b.id
+    """
+    return export_response(
+        sql,
+        params,
+        file_format,
+        "overdue_borrows",
+        replica=reads_from_replica(get_consistency_key(request)),
+    )
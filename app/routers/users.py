@@ -8,7 +8,17 @@ from datetime import datetime
 import hashlib
 import re
 
-from ..dependencies import get_conn, get_current_user_dependency
+from ..dependencies import (
+    get_conn,
+    get_read_conn,
+    get_read_fanout,
+    get_current_user_dependency,
+)
+from ..cache import invalidate_users
+from ..counters import counters
+from ..database import query
+from ..pagination import TotalMode, total_job
+from ..responses import page_response
 
 router = APIRouter()
 
@@ -54,7 +64,7 @@ class UserResetPassword(BaseModel):
 
 class UserResponse(BaseModel):
     records: List[User]  # 改为 records
-    total: int
+    total: Optional[int] = None
     current: int
     size: int
 
@@ -97,7 +107,11 @@ async def list_users(
     email: Optional[str] = Query(None, description="邮箱搜索"),
     is_active: Optional[bool] = Query(None, description="用户状态筛选"),
     is_admin: Optional[bool] = Query(None, description="管理员筛选"),
-    conn: aiomysql.Connection = Depends(get_conn),
+    total_mode: TotalMode = Query(
+        TotalMode.EXACT,
+        description="总数计算方式：exact 精确、cached 短时缓存、estimate 估算、none 不返回",
+    ),
+    fetch=Depends(get_read_fanout),
 ):
     """获取用户列表，支持分页和分字段搜索"""
     try:
@@ -136,37 +150,37 @@ async def list_users(
 
         where_clause = " AND ".join(where_conditions) if where_conditions else "1=1"
 
-        async with conn.cursor(aiomysql.DictCursor) as cursor:
-            # 查询总数
-            count_sql = f"SELECT COUNT(*) as total FROM users WHERE {where_clause}"
-            await cursor.execute(count_sql, params)
-            total_result = await cursor.fetchone()
-            total = total_result["total"]
-
-            # 查询当前页数据
-            data_sql = f"""
-                SELECT id, username, email, full_name, phone, is_active, is_admin,
-                       created_at, updated_at
-                FROM users
-                WHERE {where_clause}
-                ORDER BY created_at DESC
-                LIMIT %s OFFSET %s
-            """
-            await cursor.execute(data_sql, params + [page_size, offset])
-            users = await cursor.fetchall()
-
-            return UserResponse(
-                records=[User(**user) for user in users],
-                total=total,
-                current=page,
-                size=page_size,
-            )
+        data_sql = f"""
+            SELECT id, username, email, full_name, phone, is_active, is_admin,
+                   created_at, updated_at
+            FROM users
+            WHERE {where_clause}
+            ORDER BY created_at DESC
+            LIMIT %s OFFSET %s
+        """
+        # 总数与当前页数据并发查询
+        total, users = await fetch(
+            total_job("users", "users", where_clause, params, total_mode),
+            query(data_sql, params + [page_size, offset]),
+        )
+
+        return page_response(
+            UserResponse,
+            User,
+            users,
+            bool_fields=("is_active", "is_admin"),
+            total=total,
+            current=page,
+            size=page_size,
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取用户列表失败: {str(e)}")
 
 
 @router.get("/users/{user_id}", response_model=User)
-async def get_user(user_id: int, conn: aiomysql.Connection = Depends(get_conn)):
+async def get_user(user_id: int, conn: aiomysql.Connection = Depends(get_read_conn)):
     """获取单个用户详情"""
     try:
         async with conn.cursor(aiomysql.DictCursor) as cursor:
@@ -239,6 +253,7 @@ async def create_user(
 
             user_id = cursor.lastrowid
             await conn.commit()
+            counters.add(users=1)
 
             # 返回创建的用户信息
             return await get_user(user_id, conn)
@@ -310,6 +325,7 @@ async def update_self(
             params.append(user_id)
             await cursor.execute(sql, params)
             await conn.commit()
+            invalidate_users([user_id])
 
             # 返回更新后的用户信息
             return await get_user(user_id, conn)
@@ -377,6 +393,7 @@ async def update_user(
             params.append(user_id)
             await cursor.execute(sql, params)
             await conn.commit()
+            invalidate_users([user_id])
 
             # 返回更新后的用户信息
             return await get_user(user_id, conn)
@@ -400,6 +417,9 @@ async def delete_user(user_id: int, conn: aiomysql.Connection = Depends(get_conn
             # 删除用户
             await cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
             await conn.commit()
+            invalidate_users([user_id])
+            # 借阅记录随用户级联删除，计数器需要重新对账
+            counters.invalidate()
 
             return JSONResponse(status_code=204, content=None)
     except HTTPException:
@@ -443,6 +463,7 @@ async def change_password(
                 (new_password_hash, user_id),
             )
             await conn.commit()
+            invalidate_users([user_id])
 
             return JSONResponse(status_code=200, content={"message": "密码修改成功"})
     except HTTPException:
@@ -483,6 +504,7 @@ async def reset_user_password(
                 (new_password_hash, user_id),
             )
             await conn.commit()
+            invalidate_users([user_id])
 
             return JSONResponse(status_code=200, content={"message": "密码重置成功"})
     except HTTPException:
@@ -515,6 +537,7 @@ async def toggle_user_status(
                 (new_status, user_id),
             )
             await conn.commit()
+            invalidate_users([user_id])
 
             status_text = "启用" if new_status else "禁用"
             return JSONResponse(
@@ -541,38 +564,31 @@ async def register_user(
 @router.get("/users/stats/summary")
 async def get_user_stats(
     user: dict = Depends(get_current_user_dependency),
-    conn: aiomysql.Connection = Depends(get_conn),
+    conn: aiomysql.Connection = Depends(get_read_conn),
 ):
     """获取用户统计信息"""
     try:
         id = user.get("id")
         async with conn.cursor(aiomysql.DictCursor) as cursor:
-            # 总借阅次数
+            # 一次扫描该用户的借阅记录，同时得到总数、在借数和逾期数
             await cursor.execute(
-                "SELECT COUNT(*) as total FROM borrows WHERE user_id = %s", (id,)
-            )
-            total_borrows = (await cursor.fetchone())["total"]
-
-            # 当前借阅数
-            await cursor.execute(
-                "SELECT COUNT(*) as active FROM borrows WHERE status = 'borrowed' AND user_id = %s",
+                """
+                SELECT COUNT(*) AS total,
+                       IFNULL(SUM(status = 'borrowed'), 0) AS active,
+                       IFNULL(SUM(status = 'overdue'), 0) AS overdue
+                FROM borrows
+                WHERE user_id = %s
+                """,
                 (id,),
             )
-            active_borrows = (await cursor.fetchone())["active"]
-
-            # 逾期借阅数
-            await cursor.execute(
-                "SELECT COUNT(*) as overdue FROM borrows WHERE status = 'overdue' AND user_id = %s",
-                (id,),
-            )
-            overdue_borrows = (await cursor.fetchone())["overdue"]
+            row = await cursor.fetchone()
 
             return JSONResponse(
                 status_code=200,
                 content={
-                    "total_borrows": total_borrows,
-                    "active_borrows": active_borrows,
-                    "overdue_borrows": overdue_borrows,
+                    "total_borrows": row["total"],
+                    "active_borrows": int(row["active"]),
+                    "overdue_borrows": int(row["overdue"]),
                 },
             )
     except Exception as e:
@@ -581,44 +597,20 @@ async def get_user_stats(
 
 @router.get("/statistics")
 # 站点统计
-async def get_statistics(conn: aiomysql.Connection = Depends(get_conn)):
-    """获取站点统计信息"""
+async def get_statistics():
+    """获取站点统计信息（读取内存中的统计计数器）"""
     try:
-        async with conn.cursor(aiomysql.DictCursor) as cursor:
-            # 用户总数
-            await cursor.execute("SELECT COUNT(*) as total_users FROM users")
-            total_users = (await cursor.fetchone())["total_users"]
-
-            # 图书总数
-            await cursor.execute("SELECT COUNT(*) as total_books FROM books")
-            total_books = (await cursor.fetchone())["total_books"]
-
-            # 借阅总数
-            await cursor.execute("SELECT COUNT(*) as total_borrows FROM borrows")
-            total_borrows = (await cursor.fetchone())["total_borrows"]
-
-            # 当前借阅数
-            await cursor.execute(
-                "SELECT COUNT(*) as active_borrows FROM borrows WHERE status = 'borrowed'"
-            )
-            active_borrows = (await cursor.fetchone())["active_borrows"]
-
-            # 逾期借阅数
-            await cursor.execute(
-                "SELECT COUNT(*) as overdue_borrows FROM borrows WHERE status = 'overdue'"
-            )
-            overdue_borrows = (await cursor.fetchone())["overdue_borrows"]
-
-            return JSONResponse(
-                status_code=200,
-                content={
-                    "total_users": total_users,
-                    "total_books": total_books,
-                    "total_borrows": total_borrows,
-                    "active_borrows": active_borrows,
-                    "overdue_borrows": overdue_borrows,
-                },
-            )
+        values = await counters.snapshot()
+        return JSONResponse(
+            status_code=200,
+            content={
+                "total_users": values["users"],
+                "total_books": values["books"],
+                "total_borrows": values["borrows"],
+                "active_borrows": values["borrowed"],
+                "overdue_borrows": values["overdue"],
+            },
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取站点统计失败: {str(e)}")
 
@@ -651,6 +643,8 @@ async def batch_delete_users(
             # 执行批量删除
             await cursor.execute("DELETE FROM users WHERE id IN %s", (tuple(user_ids),))
             await conn.commit()
+            invalidate_users(user_ids)
+            counters.invalidate()
 
             return JSONResponse(status_code=204, content=None)
     except HTTPException:
@@ -0,0 +1,278 @@
+import asyncio
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from .counters import COUNTER_RECONCILE_INTERVAL, COUNTER_RECONCILE_JITTER, counters
+from .database import DB_CONFIG, acquire
+from .stock_events import STOCK_STREAM_POLL_INTERVAL, stock_broker
+from .suggest import SUGGEST_REBUILD_INTERVAL, suggest_index
+
+# 逾期标记任务：执行间隔（秒）、每批行数、批次间暂停（秒）
+OVERDUE_SWEEP_ENABLED = os.getenv("OVERDUE_SWEEP_ENABLED", "1") == "1"
+OVERDUE_SWEEP_INTERVAL = float(os.getenv("OVERDUE_SWEEP_INTERVAL", 3600))
+OVERDUE_SWEEP_BATCH_SIZE = int(os.getenv("OVERDUE_SWEEP_BATCH_SIZE", 500))
+OVERDUE_SWEEP_PAUSE = float(os.getenv("OVERDUE_SWEEP_PAUSE", 0.1))
+
+# 借阅日汇总任务：执行间隔（秒）、回填时每批汇总的天数、批次间暂停（秒）
+BORROW_ROLLUP_ENABLED = os.getenv("BORROW_ROLLUP_ENABLED", "1") == "1"
+BORROW_ROLLUP_INTERVAL = float(os.getenv("BORROW_ROLLUP_INTERVAL", 300))
+BORROW_ROLLUP_CHUNK_DAYS = int(os.getenv("BORROW_ROLLUP_CHUNK_DAYS", 7))
+BORROW_ROLLUP_PAUSE = float(os.getenv("BORROW_ROLLUP_PAUSE", 0.1))
+
+# 各后台任务的运行统计，由 /health 输出
+job_stats: dict[str, dict] = {}
+
+
+class MySQLLock:
+    """基于 GET_LOCK 的跨进程互斥锁，保证多个 worker 中只有一个执行同一任务"""
+
+    def __init__(self, conn, name: str):
+        self.conn = conn
+        self.name = f"{DB_CONFIG['db']}.{name}"
+        self.acquired = False
+
+    async def __aenter__(self):
+        async with self.conn.cursor() as cursor:
+            await cursor.execute("SELECT GET_LOCK(%s, 0)", (self.name,))
+            self.acquired = (await cursor.fetchone())[0] == 1
+        return self
+
+    async def __aexit__(self, *exc):
+        if self.acquired:
+            async with self.conn.cursor() as cursor:
+                await cursor.execute("SELECT RELEASE_LOCK(%s)", (self.name,))
+
+
+async def sweep_overdue() -> Optional[int]:
+    """按主键顺序分批把已到期未归还的借阅标记为逾期
+
+    返回更新的行数；其他 worker 正在执行时返回 None。
+    """
+    async with acquire() as conn:
+        async with MySQLLock(conn, "overdue_sweeper") as lock:
+            if not lock.acquired:
+                return None
+            rows = 0
+            last_id = 0
+            async with conn.cursor() as cursor:
+                while True:
+                    await cursor.execute(
+                        """
+                        SELECT id FROM borrows
+                        WHERE status = 'borrowed' AND due_date < NOW() AND id > %s
+                        ORDER BY id
+                        LIMIT %s
+                        """,
+                        (last_id, OVERDUE_SWEEP_BATCH_SIZE),
+                    )
+                    ids = [row[0] for row in await cursor.fetchall()]
+                    if not ids:
+                        break
+                    await cursor.execute(
+                        "UPDATE borrows SET status = 'overdue' WHERE id IN %s AND status = 'borrowed'",
+                        (tuple(ids),),
+                    )
+                    rows += cursor.rowcount
+                    counters.add(borrowed=-cursor.rowcount, overdue=cursor.rowcount)
+                    last_id = ids[-1]
+                    if len(ids) < OVERDUE_SWEEP_BATCH_SIZE:
+                        break
+                    # 批次之间让出时间，避免长时间占用锁和 IO
+                    await asyncio.sleep(OVERDUE_SWEEP_PAUSE)
+            return rows
+
+
+# 按日期区间重新汇总：三类指标分别按各自的日期列做范围查询（走索引）
+ROLLUP_QUERIES = (
+    """
+    INSERT INTO borrow_daily_rollups (day, category, borrows)
+    SELECT DATE(b.borrow_date), bk.category, COUNT(*)
+    FROM borrows b JOIN books bk ON b.book_id = bk.id
+    WHERE b.borrow_date >= %s AND b.borrow_date < %s
+    GROUP BY 1, 2
+    ON DUPLICATE KEY UPDATE borrows = VALUES(borrows)
+    """,
+    """
+    INSERT INTO borrow_daily_rollups (day, category, returns, fines)
+    SELECT DATE(b.return_date), bk.category, COUNT(*), IFNULL(SUM(b.fine_amount), 0)
+    FROM borrows b JOIN books bk ON b.book_id = bk.id
+    WHERE b.return_date >= %s AND b.return_date < %s
+    GROUP BY 1, 2
+    ON DUPLICATE KEY UPDATE returns = VALUES(returns), fines = VALUES(fines)
+    """,
+    """
+    INSERT INTO borrow_daily_rollups (day, category, overdue)
+    SELECT DATE(b.due_date), bk.category, COUNT(*)
+    FROM borrows b JOIN books bk ON b.book_id = bk.id
+    WHERE b.due_date >= %s AND b.due_date < %s AND b.due_date < NOW()
+      AND (b.return_date IS NULL OR b.return_date > b.due_date)
+    GROUP BY 1, 2
+    ON DUPLICATE KEY UPDATE overdue = VALUES(overdue)
+    """,
+)
+
+
+async def _rollup_range(conn, start: date, end: date):
+    """在一个事务中重算 [start, end) 内每天各分类的汇总行，可重复执行"""
+    async with conn.cursor() as cursor:
+        await conn.begin()
+        try:
+            await cursor.execute(
+                "DELETE FROM borrow_daily_rollups WHERE day >= %s AND day < %s",
+                (start, end),
+            )
+            for sql in ROLLUP_QUERIES:
+                await cursor.execute(sql, (start, end))
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+
+
+async def rollup_borrows() -> Optional[int]:
+    """把 borrows 增量汇总到 borrow_daily_rollups
+
+    水位线之前的日期已汇总完成，每次从水位线补到昨天并推进水位线，
+    当天的数据仍在变化，每次都重新汇总。返回本次汇总的天数；其他 worker 正在执行时返回 None。
+    """
+    async with acquire() as conn:
+        async with MySQLLock(conn, "borrow_rollup") as lock:
+            if not lock.acquired:
+                return None
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "SELECT rolled_until FROM rollup_watermarks WHERE name = 'borrow_daily'"
+                )
+                row = await cursor.fetchone()
+                if row:
+                    start = row[0]
+                else:
+                    # 首次运行从最早的借阅记录开始回填
+                    await cursor.execute("SELECT MIN(borrow_date) FROM borrows")
+                    earliest = (await cursor.fetchone())[0]
+                    start = earliest.date() if earliest else date.today()
+
+            today = date.today()
+            days = 0
+            while start < today:
+                end = min(start + timedelta(days=BORROW_ROLLUP_CHUNK_DAYS), today)
+                await _rollup_range(conn, start, end)
+                async with conn.cursor() as cursor:
+                    await cursor.execute(
+                        """
+                        INSERT INTO rollup_watermarks (name, rolled_until)
+                        VALUES ('borrow_daily', %s)
+                        ON DUPLICATE KEY UPDATE rolled_until = VALUES(rolled_until)
+                        """,
+                        (end,),
+                    )
+                days += (end - start).days
+                start = end
+                await asyncio.sleep(BORROW_ROLLUP_PAUSE)
+
+            await _rollup_range(conn, today, today + timedelta(days=1))
+            return days + 1
+
+
+async def run_periodically(
+    name: str,
+    interval: float,
+    job: Callable[[], Awaitable[Optional[int]]],
+    jitter: float = 0.0,
+):
+    """按固定间隔执行后台任务，记录耗时和处理行数；job 返回 None 表示本次跳过
+
+    jitter 大于 0 时，每次间隔在 interval 的 ±jitter 比例内随机取值，
+    首次执行也随机推迟，使各 worker 错开执行。
+    """
+    stats = job_stats.setdefault(
+        name,
+        {
+            "runs": 0,
+            "skipped": 0,
+            "errors": 0,
+            "rows_total": 0,
+            "last_run_at": None,
+            "last_duration_ms": None,
+            "last_rows": None,
+            "last_error": None,
+        },
+    )
+    if jitter:
+        await asyncio.sleep(random.uniform(0, interval * jitter))
+    while True:
+        start = time.perf_counter()
+        try:
+            rows = await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            stats["errors"] += 1
+            stats["last_error"] = str(e)
+            print(f"后台任务 {name} 执行失败: {e}")
+        else:
+            if rows is None:
+                stats["skipped"] += 1
+            else:
+                stats["runs"] += 1
+                stats["rows_total"] += rows
+                stats["last_rows"] = rows
+                stats["last_run_at"] = datetime.now().isoformat()
+                stats["last_duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        await asyncio.sleep(interval * random.uniform(1 - jitter, 1 + jitter))
+
+
+def start_background_tasks() -> list[asyncio.Task]:
+    tasks = []
+    if OVERDUE_SWEEP_ENABLED:
+        tasks.append(
+            asyncio.create_task(
+                run_periodically("overdue_sweep", OVERDUE_SWEEP_INTERVAL, sweep_overdue)
+            )
+        )
+    if BORROW_ROLLUP_ENABLED:
+        tasks.append(
+            asyncio.create_task(
+                run_periodically("borrow_rollup", BORROW_ROLLUP_INTERVAL, rollup_borrows)
+            )
+        )
+    # 每个 worker 进程维护自己的计数器，各自对账；随机错开，避免所有 worker
+    # 同时向主库发出对账查询
+    tasks.append(
+        asyncio.create_task(
+            run_periodically(
+                "counter_reconcile",
+                COUNTER_RECONCILE_INTERVAL,
+                counters.reconcile,
+                jitter=COUNTER_RECONCILE_JITTER,
+            )
+        )
+    )
+    # 首次运行即启动时的全量构建，之后定期重建以同步其他 worker 的写入
+    tasks.append(
+        asyncio.create_task(
+            run_periodically(
+                "suggest_rebuild", SUGGEST_REBUILD_INTERVAL, suggest_index.rebuild
+            )
+        )
+    )
+    # 其他 worker 的借还书不会通知本进程的订阅者，定期批量刷新已订阅图书的库存
+    tasks.append(
+        asyncio.create_task(
+            run_periodically("stock_poll", STOCK_STREAM_POLL_INTERVAL, stock_broker.poll)
+        )
+    )
+    return tasks
+
+
+async def stop_background_tasks(tasks: list[asyncio.Task]):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def get_job_stats() -> dict:
+    return job_stats
@@ -0,0 +1,172 @@
+import asyncio
+import os
+from typing import Iterable, Optional
+
+import aiomysql
+
+from .database import acquire
+from .responses import dumps
+
+# 单个 SSE 连接最多订阅的图书数量
+STOCK_STREAM_MAX_IDS = int(os.getenv("STOCK_STREAM_MAX_IDS", 100))
+# 写接口触发推送前的合并窗口（秒），窗口内的变更合并为一次批量查询
+STOCK_STREAM_DEBOUNCE = float(os.getenv("STOCK_STREAM_DEBOUNCE", 0.05))
+# 定期刷新全部已订阅图书的间隔（秒），兜底其他 worker 进程的写入
+STOCK_STREAM_POLL_INTERVAL = float(os.getenv("STOCK_STREAM_POLL_INTERVAL", 5))
+# 没有推送时发送心跳注释的间隔（秒），防止代理断开空闲连接
+STOCK_STREAM_HEARTBEAT = float(os.getenv("STOCK_STREAM_HEARTBEAT", 15))
+
+
+class StockSubscriber:
+    """一个 SSE 连接的待推送库存
+
+    只保留每本书的最新值，客户端读取较慢时积压的变更自然合并，内存占用不超过订阅的图书数。
+    """
+
+    def __init__(self, book_ids: list[int]):
+        self.book_ids = book_ids
+        self._pending: dict[int, Optional[int]] = {}
+        self._event = asyncio.Event()
+
+    def put(self, book_id: int, stock: Optional[int]):
+        self._pending[book_id] = stock
+        self._event.set()
+
+    async def get(self, timeout: float) -> dict[int, Optional[int]]:
+        """等待下一批库存变化，超时返回空字典"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+        self._event.clear()
+        pending, self._pending = self._pending, {}
+        return pending
+
+
+class StockBroker:
+    """进程内的库存变化发布/订阅
+
+    写接口提交后调用 publish() 标记图书，合并一个短窗口后用一次查询读取所有被标记且有人
+    订阅的图书库存，只把变化了的值分发给订阅者；订阅者本身不查询数据库。
+    """
+
+    def __init__(self):
+        self._subscribers: dict[int, set[StockSubscriber]] = {}
+        # 最近一次推送的库存，图书已删除时为 None
+        self._last: dict[int, Optional[int]] = {}
+        self._dirty: set[int] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self.connections = 0
+        self.queries = 0
+        self.pushes = 0
+
+    def subscribe(self, book_ids: list[int]) -> StockSubscriber:
+        subscriber = StockSubscriber(book_ids)
+        self.connections += 1
+        missing = []
+        for book_id in book_ids:
+            self._subscribers.setdefault(book_id, set()).add(subscriber)
+            if book_id in self._last:
+                subscriber.put(book_id, self._last[book_id])
+            else:
+                missing.append(book_id)
+        # 尚无人订阅过的图书，当前库存随下一次批量查询推送
+        self.publish(missing)
+        return subscriber
+
+    def unsubscribe(self, subscriber: StockSubscriber):
+        self.connections -= 1
+        for book_id in subscriber.book_ids:
+            subscribers = self._subscribers.get(book_id)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[book_id]
+                self._last.pop(book_id, None)
+
+    def publish(self, book_ids: Iterable[int]):
+        """图书库存可能发生变化后调用（事务提交之后）"""
+        self._dirty.update(book_id for book_id in book_ids if book_id in self._subscribers)
+        if self._dirty and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(STOCK_STREAM_DEBOUNCE)
+            book_ids, self._dirty = self._dirty, set()
+            await self.refresh(book_ids)
+        except Exception as e:
+            print(f"推送库存变化失败: {e}")
+        finally:
+            self._flush_task = None
+            # 查询期间又有新的变更
+            if self._dirty:
+                self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def refresh(self, book_ids: Iterable[int]) -> int:
+        """批量读取库存并推送有变化的图书，返回推送的图书数"""
+        book_ids = [book_id for book_id in book_ids if book_id in self._subscribers]
+        if not book_ids:
+            return 0
+        # 读主库，避免副本延迟导致推送旧值
+        async with acquire() as conn:
+            async with conn.cursor(aiomysql.DictCursor) as cursor:
+                await cursor.execute(
+                    "SELECT id, stock_quantity FROM books WHERE id IN %s", (tuple(book_ids),)
+                )
+                stock = {row["id"]: row["stock_quantity"] for row in await cursor.fetchall()}
+        self.queries += 1
+        changed = 0
+        for book_id in book_ids:
+            subscribers = self._subscribers.get(book_id)
+            value = stock.get(book_id)
+            if not subscribers or (book_id in self._last and self._last[book_id] == value):
+                continue
+            self._last[book_id] = value
+            for subscriber in subscribers:
+                subscriber.put(book_id, value)
+            self.pushes += len(subscribers)
+            changed += 1
+        return changed
+
+    async def poll(self) -> Optional[int]:
+        """刷新全部已订阅的图书，没有订阅者时跳过"""
+        if not self._subscribers:
+            return None
+        return await self.refresh(list(self._subscribers))
+
+    def stats(self) -> dict:
+        return {
+            "connections": self.connections,
+            "books": len(self._subscribers),
+            "queries": self.queries,
+            "pushes": self.pushes,
+        }
+
+
+stock_broker = StockBroker()
+
+
+def encode_event(book_id: int, stock: Optional[int]) -> bytes:
+    return (
+        b"event: stock\ndata: "
+        + dumps({"book_id": book_id, "stock_quantity": stock})
+        + b"\n\n"
+    )
+
+
+async def stock_event_stream(book_ids: list[int]):
+    """SSE 响应体：连接期间持续输出订阅图书的库存变化，断开时取消订阅"""
+    subscriber = stock_broker.subscribe(book_ids)
+    try:
+        # 断线后客户端 3 秒重连
+        yield b"retry: 3000\n\n"
+        while True:
+            updates = await subscriber.get(STOCK_STREAM_HEARTBEAT)
+            if not updates:
+                yield b": ping\n\n"
+                continue
+            yield b"".join(encode_event(book_id, stock) for book_id, stock in updates.items())
+    finally:
+        stock_broker.unsubscribe(subscriber)
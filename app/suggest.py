@@ -0,0 +1,163 @@
+import asyncio
+import os
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Iterable, Optional
+
+import aiomysql
+
+from .database import acquire
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:  # 未安装 pypinyin 时不支持拼音匹配
+    lazy_pinyin = None
+
+# 联想索引全量重建的间隔（秒），兜底其他 worker 进程的写入
+SUGGEST_REBUILD_INTERVAL = float(os.getenv("SUGGEST_REBUILD_INTERVAL", 600))
+
+
+def normalize(text: Optional[str]) -> str:
+    """小写并去掉空白和连字符，用作索引 key 与查询前缀"""
+    if not text:
+        return ""
+    return "".join(text.lower().replace("-", "").split())
+
+
+def build_entries(books: Iterable[dict]) -> list[tuple[str, int]]:
+    return sorted((key, book["id"]) for book in books for key in index_keys(book))
+
+
+def index_keys(book: dict) -> set[str]:
+    """一本书的全部索引 key：书名、作者、ISBN，以及书名/作者的拼音全拼和首字母"""
+    keys = {normalize(book["title"]), normalize(book["author"]), normalize(book["isbn"])}
+    if lazy_pinyin is not None:
+        for text in (book["title"], book["author"]):
+            syllables = [normalize(s) for s in lazy_pinyin(text or "")]
+            syllables = [s for s in syllables if s]
+            keys.add("".join(syllables))
+            keys.add("".join(s[0] for s in syllables))
+    keys.discard("")
+    return keys
+
+
+class SuggestIndex:
+    """图书联想的前缀索引
+
+    有序的 (key, 图书ID) 数组，查询时 bisect 定位前缀起点后顺序读取；
+    图书增删改时增量更新，并由后台任务定期全量重建。
+    """
+
+    def __init__(self):
+        self._entries: list[tuple[str, int]] = []
+        self._books: dict[int, dict] = {}
+        # 重建期间发生的增量更新：图书ID -> 图书（删除为 None），重建完成后重放
+        self._pending: Optional[dict[int, Optional[dict]]] = None
+        self._lock = asyncio.Lock()
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self._rebuild_requested = False
+        self.built_at: Optional[str] = None
+        self.queries = 0
+
+    def _insert(self, book: dict):
+        book = {name: book[name] for name in ("id", "title", "author", "isbn")}
+        self._books[book["id"]] = book
+        for key in index_keys(book):
+            insort(self._entries, (key, book["id"]))
+
+    def _remove(self, book_id: int):
+        book = self._books.pop(book_id, None)
+        if book is None:
+            return
+        for key in index_keys(book):
+            i = bisect_left(self._entries, (key, book_id))
+            if i < len(self._entries) and self._entries[i] == (key, book_id):
+                del self._entries[i]
+
+    def upsert(self, books: Iterable[dict]):
+        """新增或修改单本图书后调用，book 至少包含 id/title/author/isbn
+
+        每条 O(n) 插入，批量写入请用 schedule_rebuild()。
+        """
+        for book in books:
+            self._remove(book["id"])
+            self._insert(book)
+            if self._pending is not None:
+                self._pending[book["id"]] = book
+
+    def remove(self, book_ids: Iterable[int]):
+        for book_id in book_ids:
+            self._remove(book_id)
+            if self._pending is not None:
+                self._pending[book_id] = None
+
+    def search(self, prefix: str, limit: int = 10) -> list[dict]:
+        """返回书名、作者、ISBN 或其拼音以 prefix 开头的图书"""
+        self.queries += 1
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        i = bisect_left(self._entries, (prefix,))
+        while i < len(self._entries) and len(results) < limit:
+            key, book_id = self._entries[i]
+            if not key.startswith(prefix):
+                break
+            if book_id not in seen:
+                seen.add(book_id)
+                results.append(self._books[book_id])
+            i += 1
+        return results
+
+    async def rebuild(self, replica: bool = True) -> int:
+        """从 books 表全量重建索引，返回图书数量"""
+        async with self._lock:
+            self._pending = {}
+            try:
+                async with acquire(replica=replica) as conn:
+                    async with conn.cursor(aiomysql.DictCursor) as cursor:
+                        await cursor.execute("SELECT id, title, author, isbn FROM books")
+                        rows = await cursor.fetchall()
+                books = {row["id"]: row for row in rows}
+                # 拼音转换与排序较耗 CPU，放到线程中执行，不阻塞事件循环
+                entries = await asyncio.to_thread(build_entries, rows)
+                pending = self._pending
+            finally:
+                self._pending = None
+            self._entries, self._books = entries, books
+            # 重放查询期间发生的写入，避免被旧数据覆盖
+            for book_id, book in pending.items():
+                self._remove(book_id)
+                if book is not None:
+                    self._insert(book)
+            self.built_at = datetime.now().isoformat()
+            return len(books)
+
+    def schedule_rebuild(self):
+        """批量导入后在后台从主库重建索引；重建进行中再次调用时，结束后再重建一次"""
+        self._rebuild_requested = True
+        if self._rebuild_task is None:
+            self._rebuild_task = asyncio.create_task(self._rebuild_later())
+
+    async def _rebuild_later(self):
+        try:
+            while self._rebuild_requested:
+                self._rebuild_requested = False
+                await self.rebuild(replica=False)
+        except Exception as e:
+            print(f"重建联想索引失败: {e}")
+        finally:
+            self._rebuild_task = None
+
+    def stats(self) -> dict:
+        return {
+            "books": len(self._books),
+            "entries": len(self._entries),
+            "pinyin": lazy_pinyin is not None,
+            "built_at": self.built_at,
+            "queries": self.queries,
+        }
+
+
+suggest_index = SuggestIndex()
@@ -0,0 +1,120 @@
+"""列表接口 JSON 序列化基准：默认路径（Pydantic 模型 + jsonable_encoder）对比 FAST_JSON（orjson）
+
+纯 CPU，不需要数据库。在仓库根目录运行：
+
+    python benchmarks/bench_json.py [--rows 100] [--number 200]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+os.environ["FAST_JSON"] = "1"
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+from app import responses  # noqa: E402
+from app.routers.books import Book, BookResponse  # noqa: E402
+from app.routers.borrows import BorrowResponse, BorrowWithDetails  # noqa: E402
+
+
+def book_rows(n: int) -> list[dict]:
+    """模拟 DictCursor 返回的图书行（price 为 DECIMAL）"""
+    now = datetime(2024, 5, 1, 12, 0, 0)
+    return [
+        {
+            "id": i,
+            "title": f"图书标题 {i}",
+            "author": f"作者 {i % 50}",
+            "isbn": f"978711{i:07d}",
+            "publisher": "人民邮电出版社",
+            "publish_date": "2020-01",
+            "category": ["计算机", "文学", "历史"][i % 3],
+            "price": Decimal("59.80"),
+            "stock_quantity": i % 7,
+            "description": "这是一段图书简介。" * 5,
+            "created_at": now,
+            "updated_at": now + timedelta(minutes=i),
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def borrow_rows(n: int) -> list[dict]:
+    """模拟借阅列表联表查询返回的行"""
+    now = datetime(2024, 5, 1, 12, 0, 0)
+    return [
+        {
+            "id": i,
+            "user_id": i % 30,
+            "user_name": f"user{i % 30}",
+            "user_email": f"user{i % 30}@example.com",
+            "book_id": i,
+            "book_title": f"图书标题 {i}",
+            "book_author": f"作者 {i % 50}",
+            "book_isbn": f"978711{i:07d}",
+            "borrow_date": now,
+            "due_date": now + timedelta(days=30),
+            "return_date": None,
+            "status": "borrowed",
+            "renewal_count": 0,
+            "fine_amount": Decimal("0.00"),
+            "notes": None,
+            "days_overdue": None,
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def default_path(response_model, record_model, rows):
+    """FAST_JSON 关闭时：构造模型，再经 jsonable_encoder 与 json.dumps 输出"""
+    page = response_model(
+        records=[record_model(**row) for row in rows], total=1000, current=1, size=len(rows)
+    )
+    return JSONResponse(content=jsonable_encoder(page)).body
+
+
+def fast_path(rows):
+    """FAST_JSON 开启时：数据库行直接交给 orjson"""
+    return responses.dumps({"records": rows, "total": 1000, "current": 1, "size": len(rows)})
+
+
+def bench(name: str, func, number: int) -> float:
+    per_call = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f"  {name:<32}{per_call * 1000:>9.3f} ms")
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100, help="每页行数")
+    parser.add_argument("--number", type=int, default=200, help="每轮执行次数")
+    args = parser.parse_args()
+
+    if responses.orjson is None:
+        print("未安装 orjson，FAST_JSON 将退回标准库 json")
+
+    cases = [
+        ("books", BookResponse, Book, book_rows),
+        ("borrows", BorrowResponse, BorrowWithDetails, borrow_rows),
+    ]
+    for name, response_model, record_model, make_rows in cases:
+        rows = make_rows(args.rows)
+        print(f"{name}（{args.rows} 行/页，取 5 轮最优）")
+        slow = bench(
+            "Pydantic + jsonable_encoder",
+            lambda: default_path(response_model, record_model, rows),
+            args.number,
+        )
+        fast = bench("FAST_JSON (orjson)", lambda: fast_path(rows), args.number)
+        print(f"  {'加速比':<29}{slow / fast:>9.1f} x")
+
+
+if __name__ == "__main__":
+    main()
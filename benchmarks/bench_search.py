@@ -0,0 +1,154 @@
+"""图书搜索基准：search_mode=like 与 search_mode=fulltext 的执行计划与耗时对比
+
+使用 app/database.py 的 DB_* 环境变量连接已执行 init.sql 的 MySQL，
+查询语句由 _build_book_filters 生成，与 GET /books 完全一致。在仓库根目录运行：
+
+    python benchmarks/bench_search.py --seed 1000000   # 先写入 100 万本测试图书
+    python benchmarks/bench_search.py                   # 对比 EXPLAIN 与耗时
+    python benchmarks/bench_search.py --cleanup         # 删除测试图书
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import aiomysql  # noqa: E402
+
+from app.database import DB_CONFIG  # noqa: E402
+from app.routers.books import SearchMode, _build_book_filters  # noqa: E402
+
+# 测试图书的 ISBN 前缀，--cleanup 按此删除
+ISBN_PREFIX = "BENCH"
+
+WORDS = ["红楼", "梦", "三国", "演义", "西游", "记", "水浒", "传", "数据", "结构", "算法",
+         "设计", "网络", "原理", "历史", "中国", "世界", "简史", "编程", "实践", "Python",
+         "Java", "系统", "分析", "导论", "文学", "艺术", "经济", "哲学", "科学"]
+SURNAMES = ["王", "李", "张", "刘", "陈", "杨", "赵", "黄", "周", "吴"]
+CATEGORIES = ["计算机", "文学", "历史", "经济", "哲学", "艺术"]
+
+# (说明, 关键词)
+KEYWORDS = [
+    ("高频词", "中国"),
+    ("中频词", "红楼梦"),
+    ("低频组合", "算法导论"),
+    ("作者", "王小明"),
+    ("英文", "Python"),
+    ("无结果", "量子纠缠"),
+]
+
+
+def fake_book(i: int) -> tuple:
+    title = "".join(random.sample(WORDS, random.randint(2, 4)))
+    author = random.choice(SURNAMES) + random.choice(["小明", "建国", "伟", "芳", "磊"])
+    return (title, author, f"{ISBN_PREFIX}{i:012d}", "测试出版社", "2020",
+            random.choice(CATEGORIES), 39.9, random.randint(0, 10))
+
+
+async def seed(conn, count: int, batch_size: int = 5000):
+    async with conn.cursor() as cursor:
+        await cursor.execute(
+            "SELECT IFNULL(MAX(CAST(SUBSTRING(isbn, %s) AS UNSIGNED)), 0) FROM books WHERE isbn LIKE %s",
+            (len(ISBN_PREFIX) + 1, f"{ISBN_PREFIX}%"),
+        )
+        (start,) = await cursor.fetchone()
+        for offset in range(0, count, batch_size):
+            rows = [fake_book(start + offset + i + 1) for i in range(min(batch_size, count - offset))]
+            await cursor.executemany(
+                """
+                INSERT INTO books (title, author, isbn, publisher, publish_date, category,
+                                   price, stock_quantity)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """,
+                rows,
+            )
+            print(f"\r已写入 {offset + len(rows)}/{count}", end="", flush=True)
+    print()
+
+
+async def cleanup(conn):
+    async with conn.cursor() as cursor:
+        while True:
+            await cursor.execute(
+                "DELETE FROM books WHERE isbn LIKE %s LIMIT 10000", (f"{ISBN_PREFIX}%",)
+            )
+            if cursor.rowcount == 0:
+                break
+            print(f"已删除 {cursor.rowcount} 行")
+
+
+def build_queries(keyword: str, mode: SearchMode, size: int = 10) -> list[tuple[str, str, list]]:
+    """生成 GET /books?search=...&search_mode=... 第一页执行的两条查询"""
+    where_clause, params, order_sql, order_params, _ = _build_book_filters(
+        keyword, mode, None, None, None, None
+    )
+    return [
+        ("count", f"SELECT COUNT(*) FROM books WHERE {where_clause}", params),
+        (
+            "page",
+            f"SELECT id, title, author FROM books WHERE {where_clause} "
+            f"ORDER BY {order_sql} LIMIT %s OFFSET 0",
+            params + order_params + [size],
+        ),
+    ]
+
+
+async def explain(cursor, sql: str, params: list) -> str:
+    await cursor.execute(f"EXPLAIN {sql}", params)
+    return "; ".join(
+        f"type={row['type']} key={row['key']} rows={row['rows']} extra={row['Extra']}"
+        for row in await cursor.fetchall()
+    )
+
+
+async def timed(cursor, sql: str, params: list, repeat: int) -> float:
+    """执行 repeat 次，返回耗时中位数（毫秒）"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await cursor.execute(sql, params)
+        await cursor.fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+async def compare(conn, repeat: int):
+    async with conn.cursor(aiomysql.DictCursor) as cursor:
+        await cursor.execute("SELECT COUNT(*) AS n FROM books")
+        print(f"books 表共 {(await cursor.fetchone())['n']} 行，每条查询执行 {repeat} 次取中位数\n")
+        for label, keyword in KEYWORDS:
+            print(f"[{label}] search={keyword}")
+            for mode in SearchMode:
+                for name, sql, params in build_queries(keyword, mode):
+                    plan = await explain(cursor, sql, params)
+                    ms = await timed(cursor, sql, params, repeat)
+                    print(f"  {mode.value:<8} {name:<5} {ms:>9.2f} ms  {plan}")
+            print()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=0, help="先写入指定数量的测试图书")
+    parser.add_argument("--cleanup", action="store_true", help="删除测试图书后退出")
+    parser.add_argument("--repeat", type=int, default=5, help="每条查询的执行次数")
+    args = parser.parse_args()
+
+    conn = await aiomysql.connect(**DB_CONFIG)
+    try:
+        if args.cleanup:
+            await cleanup(conn)
+            return
+        if args.seed:
+            await seed(conn, args.seed)
+        await compare(conn, args.repeat)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
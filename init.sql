@@ -56,6 +56,25 @@ CREATE TABLE IF NOT EXISTS borrows (
     FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE
 ) ENGINE=InnoDB COMMENT='借阅记录表';
 
+-- 借阅日汇总表（由应用后台任务按天增量汇总，见 app/scheduler.py）
+CREATE TABLE IF NOT EXISTS borrow_daily_rollups (
+    day DATE NOT NULL COMMENT '日期',
+    category VARCHAR(50) NOT NULL COMMENT '图书分类',
+    borrows INT NOT NULL DEFAULT 0 COMMENT '当日借出数',
+    returns INT NOT NULL DEFAULT 0 COMMENT '当日归还数',
+    overdue INT NOT NULL DEFAULT 0 COMMENT '当日到期且未按时归还数',
+    fines DECIMAL(12,2) NOT NULL DEFAULT 0.00 COMMENT '当日归还产生的罚金',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    PRIMARY KEY (day, category)
+) ENGINE=InnoDB COMMENT='借阅日汇总表';
+
+-- 汇总任务进度
+CREATE TABLE IF NOT EXISTS rollup_watermarks (
+    name VARCHAR(50) PRIMARY KEY COMMENT '汇总任务名',
+    rolled_until DATE NOT NULL COMMENT '该日期之前（不含）的数据已汇总完成',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间'
+) ENGINE=InnoDB COMMENT='汇总任务进度表';
+
 -- 创建索引优化查询性能
 -- 用户表索引
 CREATE INDEX idx_users_email ON users(email);
@@ -68,13 +87,19 @@ CREATE INDEX idx_books_title ON books(title);
 CREATE INDEX idx_books_author ON books(author);
 CREATE INDEX idx_books_isbn ON books(isbn);
 CREATE INDEX idx_books_category ON books(category);
+-- 全文索引（ngram 分词，支持中文），供图书列表 search_mode=fulltext 使用
+CREATE FULLTEXT INDEX ft_books_title_author ON books(title, author) WITH PARSER ngram;
 CREATE INDEX idx_books_stock_quantity ON books(stock_quantity);
-CREATE INDEX idx_books_created_at ON books(created_at);
+-- (created_at, id) 复合索引支持图书列表的游标分页
+CREATE INDEX idx_books_created_at_id ON books(created_at, id);
 
 -- 借阅记录表索引
-CREATE INDEX idx_borrows_user_id ON borrows(user_id);
+-- (user_id, borrow_date) 支持用户借阅历史的游标分页（InnoDB 二级索引隐含主键 id），
+-- 同时替代原 user_id 单列索引
+CREATE INDEX idx_borrows_user_borrow_date ON borrows(user_id, borrow_date);
 CREATE INDEX idx_borrows_book_id ON borrows(book_id);
-CREATE INDEX idx_borrows_status ON borrows(status);
+-- (status, due_date) 支持逾期列表按到期时间有序分页，同时替代原 status 单列索引
+CREATE INDEX idx_borrows_status_due_date ON borrows(status, due_date);
 CREATE INDEX idx_borrows_borrow_date ON borrows(borrow_date);
 CREATE INDEX idx_borrows_due_date ON borrows(due_date);
 CREATE INDEX idx_borrows_return_date ON borrows(return_date);
@@ -194,49 +219,15 @@ FROM books bk
 LEFT JOIN borrows b ON bk.id = b.book_id
 GROUP BY bk.id, bk.title, bk.author, bk.category, bk.stock_quantity;
 
--- 创建存储过程：自动处理逾期
-DELIMITER //
-CREATE PROCEDURE UpdateOverdueStatus()
-BEGIN
-    UPDATE borrows 
-    SET status = 'overdue' 
-    WHERE status = 'borrowed' 
-    AND due_date < NOW() 
-END //
-DELIMITER ;
-
--- 创建事件：每天自动更新逾期状态
-CREATE EVENT IF NOT EXISTS UpdateOverdueEvent
-ON SCHEDULE EVERY 1 DAY
-DO
-BEGIN
-    CALL UpdateOverdueStatus();
-END;
-
+-- 逾期状态由应用后台任务按主键分批标记（见 app/scheduler.py），
+-- 不再使用一次性全表 UPDATE 的存储过程与事件
+DROP EVENT IF EXISTS UpdateOverdueEvent;
+DROP PROCEDURE IF EXISTS UpdateOverdueStatus;
 
--- 创建触发器：借书时检查库存
-DELIMITER //
-CREATE TRIGGER check_stock_before_borrow
-BEFORE INSERT ON borrows
-FOR EACH ROW
-BEGIN
-    DECLARE current_stock INT;
-    SELECT stock_quantity INTO current_stock FROM books WHERE id = NEW.book_id;
-    
-    IF current_stock <= 0 THEN
-        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = '图书库存不足，无法借阅';
-    END IF;
-END //
-DELIMITER ;
-
--- 创建触发器：借书时自动减少库存
-DELIMITER //
-CREATE TRIGGER update_stock_on_borrow
-BEFORE INSERT ON borrows
-FOR EACH ROW
-BEGIN
-    UPDATE books SET stock_quantity = stock_quantity - 1 WHERE id = NEW.book_id;
-END //
+-- 借书时的库存检查与扣减由应用在借书事务中完成（带条件的 UPDATE），
+-- 不再使用 BEFORE INSERT 触发器，避免并发借书时库存被扣成负数
+DROP TRIGGER IF EXISTS check_stock_before_borrow;
+DROP TRIGGER IF EXISTS update_stock_on_borrow;
 
 -- 创建触发器：还书时自动增加库存
 DELIMITER //
@@ -244,7 +235,7 @@ CREATE TRIGGER update_stock_on_return
 AFTER UPDATE ON borrows
 FOR EACH ROW
 BEGIN
-    IF OLD.status = 'borrowed' AND NEW.status = 'returned' THEN
+    IF OLD.status IN ('borrowed', 'overdue') AND NEW.status = 'returned' THEN
         UPDATE books SET stock_quantity = stock_quantity + 1 WHERE id = NEW.book_id;
     END IF;
 END //
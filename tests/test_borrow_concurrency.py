@@ -0,0 +1,339 @@
+"""借书事务的并发测试：200 个并发借书请求下库存不为负、每人在借不超过上限、不出现死锁
+
+默认用内存中的模拟连接运行：模拟 InnoDB 的行锁、带条件 UPDATE 的 rowcount，以及
+对 borrows 加锁读时在 user_id 索引上加的间隙锁（与其他事务的 INSERT 冲突，互相等待时报
+1213 死锁）。设置 LIBRARY_TEST_DB=1 时另外对 DB_* 环境变量指向的真实 MySQL
+（已执行 init.sql）运行同样的场景。
+"""
+
+import asyncio
+import os
+import random
+import uuid
+from collections import Counter
+from contextlib import asynccontextmanager
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("aiomysql")
+
+from fastapi import HTTPException  # noqa: E402
+from pymysql.err import OperationalError  # noqa: E402
+
+from app import database  # noqa: E402
+from app.routers.borrows import (  # noqa: E402
+    MAX_ACTIVE_BORROWS,
+    BorrowBatchCreate,
+    BorrowCreate,
+    batch_borrow_books,
+    borrow_book,
+)
+
+USERS = 20  # 用户ID相邻，加锁读 borrows 时各自的间隙锁会覆盖彼此的插入位置
+BOOKS = 10
+REQUESTS_PER_USER = 10  # 共 200 个并发请求，每个用户的最后两个请求为批量借书
+BATCH_SIZE = 3
+STOCK = 8  # 总库存 80 本，小于 20 人 x 5 本，库存和借阅上限都会成为约束
+
+
+class FakeDatabase:
+    """只实现借书接口用到的语句，已提交数据与锁在所有连接间共享"""
+
+    def __init__(self, user_ids, book_ids, stock):
+        self.active = {user_id: True for user_id in user_ids}
+        self.stock = {book_id: stock for book_id in book_ids}
+        self.borrows = []  # 已提交的 (user_id, book_id)
+        self.owners = {}  # 行锁：("users"/"books", id) -> 持有的连接
+        self.gaps = []  # 间隙锁：(下界, 上界, 持有的连接)，开区间
+
+    def gap_around(self, user_id):
+        """user_id 所在的索引间隙（不含 user_id 自身的记录）"""
+        keys = {u for u, _ in self.borrows}
+        lower = max((k for k in keys if k < user_id), default=float("-inf"))
+        upper = min((k for k in keys if k > user_id), default=float("inf"))
+        return lower, upper
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+        self.lastrowid = None
+        self._rows = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, sql, params=()):
+        conn, db = self.conn, self.conn.db
+        sql = " ".join(sql.split())
+        locking = "FOR UPDATE" in sql
+        # 让出事件循环，使并发事务交错执行
+        await asyncio.sleep(0)
+        self._rows = []
+        if "FROM users" in sql:
+            user_id = params[-1]
+            if user_id not in db.active:
+                return
+            if locking:
+                await conn.lock(("users", user_id))
+        if "borrows" in sql and sql.startswith("SELECT"):
+            user_id = params[0] if "book_id IN" in sql else params[-1]
+            if locking:
+                # 对 borrows 加锁读：next-key 锁覆盖 user_id 两侧的间隙
+                db.gaps.append((*db.gap_around(user_id), conn))
+            loans = [b for u, b in db.borrows + conn.inserts if u == user_id]
+            if "COUNT(" in sql:
+                book_id = params[0]
+                self._rows = [
+                    {
+                        "is_active": db.active.get(user_id),
+                        "borrowed_count": len(loans),
+                        "has_book": int(book_id in loans),
+                    }
+                ]
+            elif "book_id IN" in sql:
+                self._rows = [
+                    {"id": i, "book_id": b} for i, b in enumerate(loans) if b in params[1]
+                ]
+            else:
+                self._rows = [
+                    {"is_active": db.active[user_id], "book_id": b} for b in loans
+                ] or [{"is_active": db.active[user_id], "book_id": None}]
+        elif "FROM users" in sql:
+            self._rows = [{"is_active": db.active[params[-1]]}]
+        elif sql.startswith("SELECT id, stock_quantity FROM books"):
+            (book_ids,) = params
+            for book_id in sorted(b for b in book_ids if b in db.stock):
+                await conn.lock(("books", book_id))
+                self._rows.append({"id": book_id, "stock_quantity": db.stock[book_id]})
+        elif sql.startswith("UPDATE books SET stock_quantity = stock_quantity - 1"):
+            (target,) = params
+            book_ids = target if isinstance(target, tuple) else (target,)
+            self.rowcount = 0
+            for book_id in book_ids:
+                if book_id not in db.stock:
+                    continue
+                await conn.lock(("books", book_id))
+                if "stock_quantity > 0" in sql and db.stock[book_id] <= 0:
+                    continue
+                db.stock[book_id] -= 1
+                conn.undo.append(book_id)
+                self.rowcount += 1
+        elif sql.startswith("SELECT id FROM books"):
+            (book_id,) = params
+            self._rows = [{"id": book_id}] if book_id in db.stock else []
+        elif sql.startswith("INSERT INTO borrows"):
+            await conn.insert_borrow(params[0], params[1])
+            self.lastrowid = len(db.borrows) + len(conn.inserts)
+        else:
+            raise AssertionError(f"未模拟的语句: {sql}")
+
+    async def executemany(self, sql, rows):
+        for params in rows:
+            await self.execute(sql, params)
+
+    async def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    async def fetchall(self):
+        return self._rows
+
+
+class FakeConnection:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+        self.held = []
+        self.undo = []
+        self.inserts = []
+        self.waiting_for = set()
+
+    def cursor(self, *args):
+        return FakeCursor(self)
+
+    def _reaches(self, blockers) -> bool:
+        """等待图中 blockers 是否（间接）在等待自己"""
+        seen, stack = set(), list(blockers)
+        while stack:
+            conn = stack.pop()
+            if conn is self:
+                return True
+            if conn not in seen:
+                seen.add(conn)
+                stack.extend(conn.waiting_for)
+        return False
+
+    async def _wait(self, blockers_of):
+        while True:
+            blockers = blockers_of() - {self}
+            if not blockers:
+                self.waiting_for = set()
+                return
+            if self._reaches(blockers):
+                self.waiting_for = set()
+                raise OperationalError(1213, "Deadlock found when trying to get lock")
+            self.waiting_for = blockers
+            await asyncio.sleep(0)
+
+    async def lock(self, resource):
+        owners = self.db.owners
+        if owners.get(resource) is self:
+            return
+        await self._wait(lambda: {owners[resource]} if resource in owners else set())
+        owners[resource] = self
+        self.held.append(resource)
+
+    async def insert_borrow(self, user_id, book_id):
+        # 插入意向锁与其他事务在该位置上的间隙锁冲突
+        await self._wait(
+            lambda: {conn for lower, upper, conn in self.db.gaps if lower < user_id < upper}
+        )
+        self.inserts.append((user_id, book_id))
+
+    async def begin(self):
+        pass
+
+    async def commit(self):
+        await asyncio.sleep(0)
+        self.db.borrows.extend(self.inserts)
+        self._end()
+
+    async def rollback(self):
+        for book_id in self.undo:
+            self.db.stock[book_id] += 1
+        self._end()
+
+    def _end(self):
+        self.undo, self.inserts = [], []
+        for resource in self.held:
+            del self.db.owners[resource]
+        self.held = []
+        self.db.gaps = [gap for gap in self.db.gaps if gap[2] is not self]
+
+
+async def run_borrowers(connect, user_ids, book_ids) -> Counter:
+    """每个用户对不同的图书并发借书（含批量借书），返回各状态码的次数"""
+
+    async def borrow(user_id, targets):
+        async with connect() as conn:
+            try:
+                if len(targets) == 1:
+                    await borrow_book(
+                        BorrowCreate(user_id=user_id, book_id=targets[0]),
+                        conn=conn,
+                        current_user={"id": user_id},
+                    )
+                    return 201
+                response = await batch_borrow_books(
+                    BorrowBatchCreate(user_id=user_id, book_ids=targets),
+                    conn=conn,
+                    current_user={"id": user_id},
+                )
+                return response.status_code
+            except HTTPException as e:
+                return e.status_code
+
+    requests = []
+    for user_id in user_ids:
+        books = random.sample(book_ids, len(book_ids))
+        for i in range(REQUESTS_PER_USER - 2):
+            requests.append((user_id, [books[i % len(books)]]))
+        for _ in range(2):
+            requests.append((user_id, random.sample(book_ids, BATCH_SIZE)))
+    random.shuffle(requests)
+    return Counter(await asyncio.gather(*(borrow(u, b) for u, b in requests)))
+
+
+def check_invariants(results, stock, loans, book_ids):
+    """stock: 图书ID -> 剩余库存；loans: 已提交的 (user_id, book_id) 列表"""
+    # 500 即死锁或其他数据库错误，503 为连接池超时
+    assert set(results) <= {201, 400}, results
+    assert results[201] > 0 and results[400] > 0
+    assert all(stock[book_id] >= 0 for book_id in book_ids)
+    # 库存扣减与借阅记录一一对应
+    per_book = Counter(book_id for _, book_id in loans)
+    assert all(stock[book_id] + per_book[book_id] == STOCK for book_id in book_ids)
+    assert max(Counter(user_id for user_id, _ in loans).values()) <= MAX_ACTIVE_BORROWS
+    assert len(set(loans)) == len(loans)
+
+
+def test_concurrent_borrows_fake_connection():
+    async def main():
+        user_ids = list(range(1, USERS + 1))
+        book_ids = list(range(1, BOOKS + 1))
+        db = FakeDatabase(user_ids, book_ids, STOCK)
+
+        @asynccontextmanager
+        async def connect():
+            yield FakeConnection(db)
+
+        results = await run_borrowers(connect, user_ids, book_ids)
+        check_invariants(results, db.stock, db.borrows, book_ids)
+
+    asyncio.run(main())
+
+
+@pytest.mark.skipif(not os.getenv("LIBRARY_TEST_DB"), reason="设置 LIBRARY_TEST_DB=1 以连接真实 MySQL")
+def test_concurrent_borrows_mysql(monkeypatch):
+    import aiomysql
+
+    # 200 个请求共用 50 个连接，排队时间远超默认的获取连接超时
+    monkeypatch.setattr(database, "ACQUIRE_TIMEOUT", 120)
+
+    async def main():
+        tag = uuid.uuid4().hex[:8]
+        database.pool = await aiomysql.create_pool(
+            **database.DB_CONFIG, minsize=1, maxsize=50
+        )
+        user_ids, book_ids = [], []
+        try:
+            async with database.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    # 连续插入，用户ID相邻
+                    for i in range(USERS):
+                        await cursor.execute(
+                            "INSERT INTO users (username, email, hashed_password) VALUES (%s, %s, 'x')",
+                            (f"t{tag}_{i}", f"t{tag}_{i}@example.com"),
+                        )
+                        user_ids.append(cursor.lastrowid)
+                    for i in range(BOOKS):
+                        await cursor.execute(
+                            """
+                            INSERT INTO books (title, author, isbn, publisher, publish_date,
+                                               category, stock_quantity)
+                            VALUES (%s, 'test', %s, 'test', '2024', 'test', %s)
+                            """,
+                            (f"t{tag}_{i}", f"t{tag}{i:02d}", STOCK),
+                        )
+                        book_ids.append(cursor.lastrowid)
+
+            results = await run_borrowers(database.acquire, user_ids, book_ids)
+
+            async with database.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(
+                        "SELECT id, stock_quantity FROM books WHERE id IN %s", (tuple(book_ids),)
+                    )
+                    stock = dict(await cursor.fetchall())
+                    await cursor.execute(
+                        "SELECT user_id, book_id FROM borrows WHERE user_id IN %s",
+                        (tuple(user_ids),),
+                    )
+                    loans = list(await cursor.fetchall())
+            check_invariants(results, stock, loans, book_ids)
+        finally:
+            async with database.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    if user_ids:
+                        await cursor.execute("DELETE FROM users WHERE id IN %s", (tuple(user_ids),))
+                    if book_ids:
+                        await cursor.execute("DELETE FROM books WHERE id IN %s", (tuple(book_ids),))
+            database.pool.close()
+            await database.pool.wait_closed()
+            database.pool = None
+
+    asyncio.run(main())